@@ -0,0 +1,310 @@
+# BENCHMARK SUITE
+# Times every phase of running code on workloads of growing size, and finds phases that grow faster than the code
+#
+# Usage:
+#     python bench.py run [--quick] [--out FILE]
+#     python bench.py compare OLD NEW [--threshold 0.2]
+#
+# `run` prints the results as JSON, `compare` fails when a phase of NEW is slower than in OLD by more than the threshold
+
+import argparse
+import gc
+import json
+import math
+import platform
+import sys
+import time
+import quartz
+
+# Times each phase runs, the fastest one is kept
+REPEAT = 3
+
+# A phase whose time grows faster than size ^ SUPERLINEAR_EXPONENT is flagged
+SUPERLINEAR_EXPONENT = 1.3
+
+# Phases that took less than this many seconds are too fast to compare or to find their growth
+MIN_SECONDS = 0.001
+
+
+
+# WORKLOADS
+# Each workload makes a list of programs of a size
+
+# def x: 0, x + 1 + 2 + ..., which the optimizer cannot fold
+def flat_sum(size):
+    return ["def x: 0", "x + " + " + ".join(str(i) for i in range(1, size))]
+
+# ((((1))))
+def deep_nesting(size):
+    return ["(" * size + "1" + ")" * size]
+
+# def v0: 0, def v1: 1, ...
+def many_defs(size):
+    return [f"def v{i}: {i} * 2" for i in range(size)]
+
+# 7 ^ size, which is too big to be folded by the optimizer
+def huge_power(size):
+    return [f"def p: 7 ^ {size}"]
+
+# 1111.5, with `size` digits
+def long_literals(size):
+    return ["1" * size, "1" * size + ".5"]
+
+# 1 + 1 + ... + 1 / 0, which makes an error at the end of a long line
+def long_error_line(size):
+    return [" + ".join(["1"] * size) + " / 0"]
+
+# Workloads and their sizes; integers are limited to 4300 digits, so literals stay under it
+WORKLOADS = {
+    "flat_sum": (flat_sum, [500, 1000, 2000, 4000, 8000]),
+    "deep_nesting": (deep_nesting, [250, 500, 1000, 2000, 4000]),
+    "many_defs": (many_defs, [250, 500, 1000, 2000, 4000]),
+    "huge_power": (huge_power, [25000, 50000, 100000, 200000, 400000]),
+    "long_literals": (long_literals, [250, 500, 1000, 2000, 4000]),
+    "long_error_line": (long_error_line, [500, 1000, 2000, 4000, 8000]),
+}
+
+
+
+# PHASES
+# Each phase takes the state of each program and returns what the next phases need
+# A phase that cannot run a program, like the recursive parser on deep nesting, is skipped for the workload
+
+# Lex with the lexer that reads one character at a time
+def lex_scan(state):
+    return quartz.Lexer(state["fn"], state["text"]).make_tokens()
+
+# Lex with the regex lexer
+def lex_regex(state):
+    return quartz.RegexLexer(state["fn"], state["text"]).make_tokens()
+
+# Parse with the precedence climbing parser
+def parse_climbing(state):
+    return quartz.ClimbingParser(state["tokens"]).parse()
+
+# Parse with the recursive descent parser
+def parse_recursive(state):
+    return quartz.Parser(state["tokens"]).parse()
+
+# Optimize the tree
+def optimize(state):
+    return quartz.Optimizer(quartz.DEFAULT_OPT_LEVEL).optimize(state["ast"].node)
+
+# Give the variables their slots
+def resolve(state):
+    return quartz.Resolver().resolve(state["node"])
+
+# Walk the tree
+def interpret(state):
+    return quartz.Interpreter().visit(state["node"], state["session"].context)
+
+# Compile to bytecode
+def compile_code(state):
+    return quartz.Compiler().compile(state["node"])
+
+# Run the bytecode
+def vm(state):
+    return quartz.VM().execute(state["code"], state["session"].context)
+
+# Make the text of the error
+def error_text(state):
+    return state["result"].error.as_string() if state["result"].error else None
+
+# Phases in the order they run, and the name of the state they make
+PHASES = [
+    ("lex_scan", lex_scan, None),
+    ("lex_regex", lex_regex, "lex"),
+    ("parse_recursive", parse_recursive, None),
+    ("parse_climbing", parse_climbing, "ast"),
+    ("optimize", optimize, "node"),
+    ("resolve", resolve, None),
+    ("interpret", interpret, None),
+    ("compile", compile_code, "code"),
+    ("vm", vm, "result"),
+    ("error", error_text, None),
+]
+
+# Errors that mean a phase cannot run a workload
+SKIP_ERRORS = (RecursionError, ValueError, OverflowError, MemoryError)
+
+
+
+# RUNNING
+
+# Time every phase on the programs of one size
+# Returns the seconds of each phase, or None for phases that were skipped
+def time_phases(texts):
+    session = quartz.Session()
+    states = [{"fn": "<bench>", "text": text, "session": session} for text in texts]
+    seconds = {}
+
+    for name, phase, output in PHASES:
+        best = None
+        gc.disable()
+        try:
+            for _ in range(REPEAT):
+                start = time.perf_counter()
+                results = [phase(state) for state in states]
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+        except SKIP_ERRORS:
+            best = None
+        finally:
+            gc.enable()
+        seconds[name] = best
+
+        # Keep what the next phases need
+        if output == "lex":
+            for state, (tokens, error) in zip(states, results):
+                if error:
+                    raise Exception(f"Workload does not lex: {error.as_string()}")
+                state["tokens"] = tokens
+        elif output == "ast":
+            for state, ast in zip(states, results):
+                if ast.error:
+                    raise Exception(f"Workload does not parse: {ast.error.as_string()}")
+                state["ast"] = ast
+        elif output:
+            for state, result in zip(states, results):
+                state[output] = result
+
+    return seconds
+
+# Find the exponent of the growth of the times, from a least squares fit of log(seconds) to log(size)
+def growth_exponent(sizes, seconds):
+    points = [(math.log(size), math.log(s)) for size, s in zip(sizes, seconds) if s]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+
+# Run every workload with and without `stats`, and fail if the values or errors are not the same
+# The plain run goes once with an empty compile cache and once after the run with stats,
+# so a bad program that the run with stats leaves in the cache is found too
+def check_stats(quick=False):
+    for workload, (make_texts, sizes) in WORKLOADS.items():
+        for text in make_texts(sizes[0] if quick else sizes[-1]):
+            results = []
+            for stats, clear in ((None, True), (quartz.RunStats(), True), (None, False)):
+                if clear:
+                    quartz.compile_cache.clear()
+                try:
+                    value, error = quartz.Session().run("<check>", text, stats=stats)
+                    error = error.as_string() if error else None
+                except SKIP_ERRORS as exception:
+                    value, error = None, type(exception).__name__
+                results.append((value, error))
+            if results[1:] != results[:1] * 2:
+                raise Exception(f"{workload}: the runs with and without stats do not match: {results}")
+
+# Run every workload at every size
+def run_suite(quick=False):
+    check_stats(quick)
+    results = {}
+    for workload, (make_texts, sizes) in WORKLOADS.items():
+        if quick:
+            sizes = sizes[:3]
+        times = {name: [] for name, _, _ in PHASES}
+        for size in sizes:
+            for name, seconds in time_phases(make_texts(size)).items():
+                times[name].append(seconds)
+
+        results[workload] = {}
+        for name, seconds in times.items():
+            # Phases that were skipped at any size are not compared
+            if None in seconds:
+                results[workload][name] = {"sizes": sizes, "seconds": seconds, "skipped": True}
+                continue
+            exponent = growth_exponent(sizes, seconds)
+            results[workload][name] = {
+                "sizes": sizes,
+                "seconds": seconds,
+                "exponent": None if exponent is None else round(exponent, 3),
+                "superlinear": (exponent is not None and exponent > SUPERLINEAR_EXPONENT
+                                and max(seconds) >= MIN_SECONDS),
+            }
+
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "quick": quick,
+        "results": results,
+    }
+
+# Compare the results of two runs
+# Returns the regressions that are bigger than the threshold, as (workload, phase, size, old seconds, new seconds)
+def compare(old, new, threshold):
+    regressions = []
+    for workload, phases in new["results"].items():
+        for name, new_phase in phases.items():
+            old_phase = old["results"].get(workload, {}).get(name)
+            if old_phase is None or old_phase.get("skipped") or new_phase.get("skipped"):
+                continue
+
+            # Compare the biggest size both runs have
+            sizes = set(old_phase["sizes"]) & set(new_phase["sizes"])
+            if not sizes:
+                continue
+            size = max(sizes)
+            old_seconds = old_phase["seconds"][old_phase["sizes"].index(size)]
+            new_seconds = new_phase["seconds"][new_phase["sizes"].index(size)]
+            if max(old_seconds, new_seconds) < MIN_SECONDS:
+                continue
+            if new_seconds > old_seconds * (1 + threshold):
+                regressions.append((workload, name, size, old_seconds, new_seconds))
+    return regressions
+
+
+
+# MAIN
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every phase of running Quartz code")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and print the results as JSON")
+    run_parser.add_argument("--quick", action="store_true", help="only run the smaller sizes")
+    run_parser.add_argument("--out", help="file to write the results to")
+
+    compare_parser = commands.add_parser("compare", help="fail if NEW is slower than OLD")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_suite(args.quick)
+        text = json.dumps(results, indent=2)
+        if args.out:
+            with open(args.out, "w") as file:
+                file.write(text + "\n")
+        else:
+            print(text)
+
+        # Super-linear phases are shown, but do not fail the run
+        for workload, phases in results["results"].items():
+            for name, phase in phases.items():
+                if phase.get("superlinear"):
+                    print(f"super-linear: {workload} {name} grows like size ^ {phase['exponent']}", file=sys.stderr)
+
+    else:
+        with open(args.old) as file:
+            old = json.load(file)
+        with open(args.new) as file:
+            new = json.load(file)
+
+        regressions = compare(old, new, args.threshold)
+        for workload, name, size, old_seconds, new_seconds in regressions:
+            print(
+                f"regression: {workload} {name} at size {size}: "
+                f"{old_seconds * 1000:.2f} ms -> {new_seconds * 1000:.2f} ms "
+                f"({new_seconds / old_seconds - 1:+.0%})"
+            )
+        if regressions:
+            sys.exit(1)
+        print("no regressions")
+
+if __name__ == "__main__":
+    main()
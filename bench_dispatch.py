@@ -0,0 +1,86 @@
+# DISPATCH BENCHMARK
+# Measures how long `Interpreter.visit` takes to find the code for each node
+#
+# Usage: python bench_dispatch.py [number of terms]
+#
+# "getattr" finds the visit method by name and the operator with an if/elif chain on every node,
+# which is how the interpreter worked before; "table" is the interpreter in `quartz`
+
+import sys
+import timeit
+import quartz
+
+# Interpreter that finds its methods and operators like the old interpreter did
+class GetattrInterpreter(quartz.Interpreter):
+    # Visit
+    def visit(self, node, context):
+        method_name = f"visit_{type(node).__name__}"
+        method = getattr(self, method_name, self.no_visit_method)
+        return method(node, context)
+
+    # Binary operator node
+    def visit_BinOpNode(self, node, context):
+        res = quartz.RTResult()
+        left = res.register(self.visit(node.left_node, context))
+        if res.error:
+            return res
+        right = res.register(self.visit(node.right_node, context))
+        if res.error:
+            return res
+
+        op = node.op_tok.type
+        if op == quartz.TT_PLUS:
+            result = left + right
+        elif op == quartz.TT_MINUS:
+            result = left - right
+        elif op == quartz.TT_MULT:
+            result = left * right
+        elif op == quartz.TT_DIV:
+            if right == 0:
+                return res.failure(quartz.division_error(node.right_node, context))
+            result = left / right
+        elif op == quartz.TT_MOD:
+            if right == 0:
+                return res.failure(quartz.division_error(node.right_node, context))
+            result = left % right
+        elif op == quartz.TT_POW:
+            result = left ** right
+        return res.success(result)
+
+# Make code that uses every operator, grouped so the tree stays shallow for the interpreter
+def make_code(terms):
+    parts = [f"(x * {i} - 2 / 3 + -{i} % 7 ^ 2)" for i in range(terms)]
+    while len(parts) > 1:
+        parts = [f"({' + '.join(parts[i:i + 2])})" for i in range(0, len(parts), 2)]
+    return parts[0]
+
+# Count the nodes in a tree
+def count_nodes(node):
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        for field in quartz.NODE_CHILDREN[type(node)]:
+            stack.append(getattr(node, field))
+    return count
+
+# Run the benchmark
+def main(terms=2000, repeat=5):
+    code = make_code(terms)
+    node = quartz.ClimbingParser(quartz.RegexLexer("<bench>", code).iter_tokens()).parse().node
+    quartz.Resolver().resolve(node)
+    nodes = count_nodes(node)
+
+    context = quartz.Context("<program>")
+    context.symbol_table = quartz.SymbolTable()
+    context.symbol_table.set("x", 3)
+
+    print(f"{nodes} nodes")
+    print(f"{'dispatch':<10}{'ns/node':>10}")
+    for name, interpreter in (("getattr", GetattrInterpreter()), ("table", quartz.Interpreter())):
+        seconds = min(timeit.repeat(lambda: interpreter.visit(node, context), number=1, repeat=repeat))
+        print(f"{name:<10}{seconds / nodes * 1e9:>10.1f}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
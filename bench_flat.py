@@ -0,0 +1,69 @@
+# FLAT TREE BENCHMARK
+# Compares the memory and run time of a tree of node objects with a `FlatTree` of the same code
+#
+# Usage: python bench_flat.py [number of terms]
+
+import sys
+import time
+import tracemalloc
+import quartz
+
+# Make code with a lot of nodes, like generated formulas
+# The terms are added as a balanced tree, so the tree interpreter does not hit the recursion limit
+def make_code(terms):
+    parts = [f"(x{i % 10} * {i} - -{i}.5) / (y + {i % 3})" for i in range(terms)]
+    while len(parts) > 1:
+        parts = [f"({' + '.join(parts[i:i + 2])})" for i in range(0, len(parts), 2)]
+    return parts[0]
+
+# Measure the bytes that making something with `make` takes and keeps
+def measure(make):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = make()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, used
+
+# Time the fastest of a few runs of `function`
+def best_time(function, runs=5):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+# Run the benchmark
+def main(terms=50_000):
+    code = make_code(terms)
+    session = quartz.Session()
+    for i in range(10):
+        session.run("<bench>", f"def x{i}: {i}")
+    session.run("<bench>", "def y: 2")
+
+    # Parse into node objects and into arrays, the tokens are not kept by either
+    node, node_bytes = measure(lambda: quartz.ClimbingParser(quartz.RegexLexer("<bench>", code).iter_tokens()).parse().node)
+    (tree, error), tree_bytes = measure(lambda: quartz.parse_flat("<bench>", code))
+    if error:
+        raise Exception(error.as_string())
+    quartz.Resolver().resolve(node)
+    count = len(tree)
+
+    print(f"{count} nodes")
+    print(f"{'layout':<10}{'bytes/node':>12}{'parse ms':>10}{'run ms':>10}")
+
+    parse_nodes, _ = best_time(lambda: quartz.ClimbingParser(quartz.RegexLexer("<bench>", code).iter_tokens()).parse())
+    run_nodes, tree_result = best_time(lambda: quartz.Interpreter().visit(node, session.context))
+    print(f"{'objects':<10}{node_bytes / count:>12.1f}{parse_nodes * 1000:>10.1f}{run_nodes * 1000:>10.1f}")
+
+    parse_flat, _ = best_time(lambda: quartz.parse_flat("<bench>", code))
+    run_flat, flat_result = best_time(lambda: quartz.FlatEvaluator().evaluate(tree, session.context))
+    print(f"{'flat':<10}{tree_bytes / count:>12.1f}{parse_flat * 1000:>10.1f}{run_flat * 1000:>10.1f}")
+    print(f"arrays alone: {tree.nbytes() / count:.1f} bytes/node")
+
+    assert tree_result.value == flat_result.value, (tree_result.value, flat_result.value)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50_000)
@@ -0,0 +1,84 @@
+# MEMORY BENCHMARK
+# Measures how many bytes each token and node takes
+#
+# Usage: python bench_memory.py [number of terms]
+#
+# "slots" is the layout used by Quartz, "dict" is the same classes with a normal `__dict__`,
+# which is how they were stored before they had `__slots__`
+
+import sys
+import tracemalloc
+import quartz
+
+# Classes that get a `__dict__` version
+CLASSES = [
+    "Token", "NumberNode", "VarAccessNode", "VarAssignNode",
+    "BinOpNode", "UnaryOpNode", "ParseResult",
+]
+
+# Make code with a lot of tokens and nodes
+def make_code(terms):
+    parts = [f"(x{i % 10} * {i} - -{i}.5)" for i in range(terms)]
+    return "def total: " + " + ".join(parts)
+
+# Count the nodes in a tree
+def count_nodes(node):
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        for field in quartz.NODE_CHILDREN[type(node)]:
+            stack.append(getattr(node, field))
+    return count
+
+# Measure the bytes of the tokens and nodes made with the classes that are in `quartz` right now
+# The parser makes its nodes with `builder` (see `quartz.NodeBuilder`)
+def measure(code, builder=None):
+    tracemalloc.start()
+
+    # Tokens
+    before = tracemalloc.get_traced_memory()[0]
+    tokens, error = quartz.RegexLexer("<bench>", code).make_tokens()
+    token_bytes = tracemalloc.get_traced_memory()[0] - before
+
+    # Nodes
+    before = tracemalloc.get_traced_memory()[0]
+    node = quartz.Parser(tokens, builder).parse().node
+    node_bytes = tracemalloc.get_traced_memory()[0] - before
+
+    tracemalloc.stop()
+    return token_bytes, node_bytes, tokens, node
+
+# Run the benchmark
+def main(terms=100_000):
+    code = make_code(terms)
+    token_bytes, node_bytes, tokens, node = measure(code)
+    token_count = len(tokens)
+    node_count = count_nodes(node)
+    results = {"slots": (token_bytes, node_bytes)}
+    del tokens, node
+
+    # Swap in versions of the classes that have a `__dict__`
+    originals = {name: getattr(quartz, name) for name in CLASSES}
+    try:
+        for name, cls in originals.items():
+            setattr(quartz, name, type(name, (cls, ), {}))
+        builder = quartz.NodeBuilder()
+        builder.number = quartz.NumberNode
+        builder.var_access = quartz.VarAccessNode
+        builder.var_assign = quartz.VarAssignNode
+        builder.bin_op = quartz.BinOpNode
+        builder.unary_op = quartz.UnaryOpNode
+        results["dict"] = measure(code, builder)[:2]
+    finally:
+        for name, cls in originals.items():
+            setattr(quartz, name, cls)
+
+    print(f"{token_count} tokens, {node_count} nodes")
+    print(f"{'layout':<8}{'bytes/token':>14}{'bytes/node':>14}")
+    for layout, (token_bytes, node_bytes) in results.items():
+        print(f"{layout:<8}{token_bytes / token_count:>14.1f}{node_bytes / node_count:>14.1f}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
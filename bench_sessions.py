@@ -0,0 +1,63 @@
+# SESSION BENCHMARK
+# Runs many sessions at the same time in a pool of threads and checks that they never see each other's variables
+#
+# Usage: python bench_sessions.py [number of sessions] [number of threads]
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import quartz
+
+# Number of times each session runs each piece of code
+# More than `quartz.TIER_THRESHOLD`, so the tiered backend also runs the code as Python code
+ROUNDS = 100
+
+# Run the same code in one session, with values only that session has
+# Returns the number of pieces of code that ran
+def work(index, sessions):
+    session = quartz.Session()
+    backend = quartz.BACKENDS[index % len(quartz.BACKENDS)]
+    runs = 0
+
+    # A variable with the same name in every session, and one only this session has
+    result, error = session.run("<bench>", f"def x: {index}", backend)
+    assert error is None and result == index
+    result, error = session.run("<bench>", f"def only{index}: 1", backend)
+    assert error is None
+    runs += 2
+
+    for i in range(ROUNDS):
+        # Every session changes `y`, but only sees its own value
+        result, error = session.run("<bench>", "def y: x * 2 + null", backend)
+        assert error is None and result == index * 2, (index, result)
+        result, error = session.run("<bench>", "y - x", backend)
+        assert error is None and result == index, (index, result)
+
+        # The variables of other sessions are not defined
+        other = (index + 1 + i % (sessions - 1)) % sessions
+        result, error = session.run("<bench>", f"only{other}", backend)
+        assert error is not None and error.details == f"'only{other}' is not defined", (index, other)
+        runs += 3
+
+    # Built-in variables can be changed in a session without changing them for the others
+    result, error = session.run("<bench>", "def null: 7", backend)
+    assert error is None and session.run("<bench>", "null")[0] == 7
+    assert quartz.Session().run("<bench>", "null")[0] == 0
+    return runs + 3
+
+# Run the benchmark
+def main(sessions=200, threads=8):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        runs = sum(pool.map(lambda index: work(index, sessions), range(sessions)))
+    seconds = time.perf_counter() - start
+
+    # `run` uses its own session, which none of the threads changed
+    for name in ("x", "y", "only0"):
+        assert quartz.global_symbol_table.get(name) is None, name
+
+    print(f"{sessions} sessions, {threads} threads, {runs} runs")
+    print(f"{seconds:.2f} s, {runs / seconds:.0f} runs/s, no session saw another session's variables")
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
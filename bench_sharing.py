@@ -0,0 +1,61 @@
+# SUBTREE SHARING BENCHMARK
+# Compares running generated formulas that repeat the same subtrees, with and without `share`
+#
+# Usage: python bench_sharing.py [copies] [runs]
+
+import sys
+import time
+import quartz
+
+# Make a formula that uses the same subtree `copies` times, like ((a*b + c) ^ 2 / (a*b + c) + ...)
+def make_code(copies):
+    term = "(a * b + c * (a - b) ^ 2)"
+    return " + ".join(f"{term} * {term} / ({term} + {i})" for i in range(copies))
+
+# Count the nodes of a tree that are different objects
+def count_unique_nodes(node):
+    seen = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        for field in quartz.NODE_CHILDREN[type(node)]:
+            stack.append(getattr(node, field))
+    return len(seen)
+
+# Time running the formula on one backend
+# Returns the fastest time of a run in microseconds and the value
+def time_runs(session, code, backend, share, runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        value, error = session.run("<bench>", code, backend=backend, share=share)
+        elapsed = time.perf_counter() - start
+        if error:
+            raise Exception(error.as_string())
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1e6, value
+
+# Run the benchmark
+def main(copies=50, runs=20):
+    code = make_code(copies)
+    session = quartz.Session()
+    for text in ("def a: 3", "def b: 5", "def c: 7"):
+        session.run("<bench>", text)
+
+    tree = session.compile("<bench>", code, share=False)
+    graph = session.compile("<bench>", code, share=True)
+    print(f"{copies} copies: {count_unique_nodes(tree.node)} nodes as a tree, "
+          f"{count_unique_nodes(graph.node)} shared, {len(graph.shared)} used more than once")
+
+    print(f"{'backend':<14}{'tree us':>12}{'shared us':>12}{'speedup':>10}")
+    for backend in ("interpreter", "vm", "tiered"):
+        tree_us, tree_value = time_runs(session, code, backend, False, runs)
+        shared_us, shared_value = time_runs(session, code, backend, True, runs)
+        assert tree_value == shared_value, (tree_value, shared_value)
+        print(f"{backend:<14}{tree_us:>12.1f}{shared_us:>12.1f}{tree_us / shared_us:>9.2f}x")
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,80 @@
+# WARM START BENCHMARK
+# Compares starting a new process that runs a library of formulas from scratch with one that uses
+# the disk cache of programs, and with one that loads a snapshot of the variables
+#
+# Usage: python bench_warm_start.py [formulas]
+#
+# Every way starts a new Python process, like a worker does, and reports how long getting its variables took
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import quartz
+
+# Make a library of formulas, each one reads some of the ones before it
+def make_library(size):
+    texts = [f"def base{i}: {i} * 1.5" for i in range(50)]
+    for i in range(size - len(texts)):
+        terms = " + ".join(f"(base{(i + j) % 50} * {j + 1} - {i % 7}) / {j + 2}" for j in range(8))
+        texts.append(f"def f{i}: {terms}")
+    return texts
+
+# Get the variables ready in this process in one of the ways, and print the seconds it took
+def child(mode, folder, size):
+    start = time.perf_counter()
+    if mode == "snapshot":
+        quartz.load_snapshot(os.path.join(folder, "snapshot.qzs"))
+    else:
+        if mode != "cold":
+            quartz.disk_cache = quartz.DiskCache(os.path.join(folder, "programs"))
+        for text in make_library(size):
+            value, error = quartz.run("<library>", text)
+            if error:
+                raise Exception(error.as_string())
+        if mode == "save":
+            quartz.save_snapshot(os.path.join(folder, "snapshot.qzs"))
+    elapsed = time.perf_counter() - start
+    print(elapsed, len(quartz.global_symbol_table.as_dict()))
+
+# Start a process that gets its variables ready in one of the ways
+# Returns the seconds it took inside the process, the seconds of the whole process and the number of variables
+def start_process(mode, folder, size):
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, folder, str(size)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    total = time.perf_counter() - start
+    inside, variables = output.split()
+    return float(inside), total, int(variables)
+
+# Run the benchmark
+def main(size=3000):
+    folder = tempfile.mkdtemp(prefix="quartz-warm-start-")
+    try:
+        runs = [
+            ("cold", "no disk cache"),
+            ("save", "empty disk cache, saves the programs and a snapshot"),
+            ("warm", "full disk cache"),
+            ("snapshot", "snapshot of the variables"),
+        ]
+        print(f"{size} formulas")
+        print(f"{'start':<52}{'inside s':>10}{'process s':>11}{'variables':>11}")
+        results = {}
+        for mode, name in runs:
+            inside, total, variables = start_process(mode, folder, size)
+            results[mode] = inside
+            print(f"{name:<52}{inside:>10.3f}{total:>11.3f}{variables:>11}")
+        print(f"disk cache: {results['cold'] / results['warm']:.1f}x faster, "
+              f"snapshot: {results['cold'] / results['snapshot']:.1f}x faster")
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main(*(int(arg) for arg in sys.argv[1:2]))
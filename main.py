@@ -1,24 +1,139 @@
-from termcolor import colored
+import argparse
+import json
+import sys
 import quartz
 
+# Bytes read from stdin at a time in batch mode
+BATCH_READ_SIZE = 1 << 20
+
+parser = argparse.ArgumentParser(description="Quartz")
+parser.add_argument("file", nargs="?", help="file to run instead of the REPL")
+parser.add_argument("--batch", action="store_true", help="run each line of stdin (the default when stdin is not a terminal)")
+parser.add_argument("--json", action="store_true", help="in batch mode, write one JSON object per line with its line number")
+args = parser.parse_args()
+
+
+
+# BATCH MODE
+# Runs every line of stdin with one session, and writes the results without colors, a banner or a prompt
+# Results go to stdout and errors to stderr, or both to stdout as JSON lines with --json
+# Output is written once per block of input instead of once per line
+
+# Read the lines of a stream in big blocks
+# Yields lists of lines; a line is only split from the next one at a new line, even across blocks
+def read_lines(stream):
+    pending = []
+    while True:
+        block = stream.read1(BATCH_READ_SIZE)
+        if not block:
+            break
+        end = block.rfind(b"\n") + 1
+        if not end:
+            pending.append(block)
+            continue
+        pending.append(block[:end])
+        yield b"".join(pending).decode("utf-8", "replace").split("\n")[:-1]
+        pending = [block[end:]]
+
+    # The last line does not need a new line
+    rest = b"".join(pending)
+    if rest:
+        yield [rest.decode("utf-8", "replace")]
+
+# Run every line of stdin
+# Returns the exit code: 1 if any line had an error
+def run_batch(as_json):
+    session = quartz.Session()
+    stdout, stderr = sys.stdout, sys.stderr
+    failed = False
+    line_number = 0
+
+    for lines in read_lines(sys.stdin.buffer):
+        out = []
+        errors = []
+        for text in lines:
+            line_number += 1
+            if not text.strip():
+                continue
+
+            # Python errors, like a float that is too big, are reported like Quartz errors
+            # The result is written inside the try too, since an integer with too many digits cannot be turned into text
+            try:
+                result, error = session.run("<stdin>", text)
+                message = error.as_string() if error else None
+                if as_json:
+                    # JSON does not have complex numbers, infinities or integers with too many digits
+                    line = json.dumps({"line": line_number, "result": quartz.json_value(result), "error": message})
+                elif message is None:
+                    line = f"{quartz.json_value(result)}"
+            except Exception as exception:
+                message = f"{type(exception).__name__}: {exception}"
+                if as_json:
+                    line = json.dumps({"line": line_number, "result": None, "error": message})
+
+            if message is not None:
+                failed = True
+            if as_json or message is None:
+                out.append(line + "\n")
+            else:
+                errors.append(f"line {line_number}:\n{message}\n")
+
+        stdout.write("".join(out))
+        stdout.flush()
+        if errors:
+            stderr.write("".join(errors))
+            stderr.flush()
+
+    return 1 if failed else 0
+
+if args.file is None and (args.batch or args.json or not sys.stdin.isatty()):
+    sys.exit(run_batch(args.json))
+
+
+
+# REPL
+# Colors are only loaded here, so batch mode does not need termcolor
+
+from termcolor import colored
+
 def printTxt(txt, clr):
     print(colored(txt, clr))
 
-printTxt("Quartz - Alpha v1.0.2", "green")
+# Run a file instead of the REPL: python main.py file.qz
+if args.file is not None:
+    result, error = quartz.run_file(args.file)
+    if error:
+        printTxt(error.as_string(), "red")
+        sys.exit(1)
+    sys.exit(0)
+
+printTxt(f"Quartz - {quartz.VERSION}", "green")
+
+# Commands of the REPL, they start with ':'
+# :stats turns showing the times and counts of each run on and off
+show_stats = False
 
 while True:
-    text = input("\n> ");
+    # Ctrl-D ends the REPL
+    try:
+        text = input("\n> ");
+    except EOFError:
+        print()
+        break
     if not text:
         continue
-    result, error = quartz.run("<console>", text)
+
+    if text.strip() == ":stats":
+        show_stats = not show_stats
+        printTxt(f"  Stats are {'on' if show_stats else 'off'}", "yellow")
+        continue
+
+    stats = quartz.RunStats() if show_stats else None
+    result, error = quartz.run("<console>", text, stats=stats)
 
     if error:
         printTxt(error.as_string(), "red")
     else:
         print("  " + str(result))
-
-
-
-
-
-
+    if stats:
+        printTxt("\n".join("  " + line for line in repr(stats).split("\n")), "yellow")
@@ -1,9 +1,31 @@
 # INIT
 # Initialize the basic things
 
+import bisect
+import copy
+import decimal
+import hashlib
+import heapq
+import itertools
+import marshal
+import math
+import mmap
+import operator
+import os
+import re
 import string
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from strings_with_arrows import *
 
+VERSION = "Alpha v1.1.0"
+
 DIGITS = "0123456789"
 LETTERS = string.ascii_letters
 LETTERS_DIGITS = LETTERS + DIGITS
@@ -26,7 +48,7 @@ class Error:
     def as_string(self):
         msg = f"  {self.error_name}: {self.details}"
         msg += f"\n    at {self.pos_start.fn}:{self.pos_start.ln + 1}:{self.pos_start.col + 1}"
-        msg += "\n    " + string_with_arrows(self.pos_start.ftxt, self.pos_start, self.pos_end)
+        msg += "\n    " + string_with_arrows(self.pos_start.source, self.pos_start, self.pos_end)
         return msg
 
 # Character error
@@ -41,6 +63,13 @@ class SyntaxError(Error):
     def __init__(self, pos_start, pos_end, details=""):
         super().__init__(pos_start, pos_end, 'SyntaxError', details)
 
+# Raised by a token stream when it finds a CharError, so the parser stops reading it
+class LexError(Exception):
+    # Initialize
+    def __init__(self, error):
+        super().__init__(error.details)
+        self.error = error
+
 # Runtime error
 class RTError(Error):
     # Initialize
@@ -52,7 +81,7 @@ class RTError(Error):
     def as_string(self):
         result = self.generate_traceback()
         result += f"{self.error_name}: {self.details}\n"
-        result += "    " + string_with_arrows(self.pos_start.ftxt, self.pos_start, self.pos_end)
+        result += "    " + string_with_arrows(self.pos_start.source, self.pos_start, self.pos_end)
         return result
     
     # Generate traceback
@@ -69,34 +98,125 @@ class RTError(Error):
         
         return "  Traceback (most recent call last):" + result
 
+# Runtime errors made when a run goes over its budget (see `Budget`)
+# Too many steps
+class StepLimitError(RTError):
+    # Initialize
+    def __init__(self, pos_start, pos_end, details, context):
+        super().__init__(pos_start, pos_end, details, context)
+        self.error_name = "StepLimitError"
+
+# Took too long
+class TimeLimitError(RTError):
+    # Initialize
+    def __init__(self, pos_start, pos_end, details, context):
+        super().__init__(pos_start, pos_end, details, context)
+        self.error_name = "TimeLimitError"
+
+# A number would get too big
+class SizeLimitError(RTError):
+    # Initialize
+    def __init__(self, pos_start, pos_end, details, context):
+        super().__init__(pos_start, pos_end, details, context)
+        self.error_name = "SizeLimitError"
+
 
 
 # POSITION
 # Handles the position of the user's code
 
+# The user's code and its file name
+# Tokens and nodes only keep offsets into the code, lines and columns are found when they are needed
+# `first_line` and `first_col` are the line and column of the file the code starts at, when the code is only a part of a file
+class Source:
+    # Initialize
+    def __init__(self, fn, text, first_line=0, first_col=0):
+        self.fn = fn
+        self.text = text
+        self.first_line = first_line
+        self.first_col = first_col
+        self._line_starts = None
+
+    # Offsets where each line starts, made the first time they are needed
+    @property
+    def line_starts(self):
+        if self._line_starts is None:
+            starts = [0]
+            idx = self.text.find("\n")
+            while idx != -1:
+                starts.append(idx + 1)
+                idx = self.text.find("\n", idx + 1)
+            self._line_starts = starts
+        return self._line_starts
+
+    # Line and column of an offset
+    def line_col(self, idx):
+        starts = self.line_starts
+        ln = bisect.bisect_right(starts, idx) - 1
+        return ln + self.first_line, idx - starts[ln] + (self.first_col if ln == 0 else 0)
+
+    # Offset of the first new line at or after an offset, or the length of the code
+    def find_newline(self, idx):
+        starts = self.line_starts
+        line = bisect.bisect_left(starts, idx + 1)
+        return starts[line] - 1 if line < len(starts) else len(self.text)
+
+    # Offset of the last new line before an offset, or -1
+    def rfind_newline(self, idx):
+        starts = self.line_starts
+        line = bisect.bisect_right(starts, idx) - 1
+        return starts[line] - 1 if line > 0 else -1
+
 class Position:
+    __slots__ = ("idx", "source")
+
     # Initialize
-    def __init__(self, idx, ln, col, fn, ftxt):
+    def __init__(self, idx, source):
         self.idx = idx
-        self.ln = ln
-        self.col = col
-        self.fn = fn
-        self.ftxt = ftxt
+        self.source = source
+
+    # Line
+    @property
+    def ln(self):
+        return self.source.line_col(self.idx)[0]
+
+    # Column
+    @property
+    def col(self):
+        return self.source.line_col(self.idx)[1]
+
+    # File name
+    @property
+    def fn(self):
+        return self.source.fn
+
+    # File text
+    @property
+    def ftxt(self):
+        return self.source.text
 
     # Advance
-    def advance(self, current_char=None):
+    def advance(self):
         self.idx += 1
-        self.col += 1
-
-        if current_char == '\n':
-            self.ln += 1
-            self.col = 0
-        
         return self
 
     # Copy
     def copy(self):
-        return Position(self.idx, self.ln, self.col, self.fn, self.ftxt)
+        return Position(self.idx, self.source)
+
+# Parent class of everything that starts and ends somewhere in the code
+class Span:
+    __slots__ = ("start", "end", "source")
+
+    # Start position
+    @property
+    def pos_start(self):
+        return Position(self.start, self.source)
+
+    # End position
+    @property
+    def pos_end(self):
+        return Position(self.end, self.source)
 
 
 
@@ -126,19 +246,17 @@ KEYWORDS = [
 ]
 
 # Token class
-class Token:
+class Token(Span):
+    __slots__ = ("type", "value")
+
     # Init
-    def __init__(self, typ, value=None, pos_start=None, pos_end=None):
+    # A token ends one character after its start if no end is given
+    def __init__(self, typ, value=None, start=None, end=None, source=None):
         self.type = typ
         self.value = value
-
-        if pos_start:
-            self.pos_start = pos_start.copy()
-            self.pos_end = pos_start.copy()
-            self.pos_end.advance()
-        
-        if pos_end:
-            self.pos_end = pos_end.copy()
+        self.start = start
+        self.end = start + 1 if end is None and start is not None else end
+        self.source = source
     
     # Matches
     def matches(self, typ, value):
@@ -154,18 +272,20 @@ class Token:
 # LEXER
 
 # Lexer class
+# Lexing starts at the offset `start` of the text, `first_line` and `first_col` are the line and column of the file the text starts at
 class Lexer:
     # Initialize
-    def __init__(self, fn, text):
+    def __init__(self, fn, text, start=0, first_line=0, first_col=0):
         self.fn = fn
         self.text = text
-        self.pos = Position(-1, 0, -1, fn, text)
+        self.source = Source(fn, text, first_line, first_col)
+        self.pos = Position(start - 1, self.source)
         self.current_char = None
         self.advance()
 	
     # Advance position in code
     def advance(self):
-        self.pos.advance(self.current_char)
+        self.pos.advance()
         if self.pos.idx < len(self.text):
             self.current_char = self.text[self.pos.idx]
         else:
@@ -173,54 +293,59 @@ class Lexer:
 
     # Make tokens
     def make_tokens(self):
-        # Store all the tokens
-        tokens = []
-
+        try:
+            return list(self.iter_tokens()), None
+        except LexError as error:
+            return [], error.error
+
+    # Make tokens one at a time
+    # Raises a LexError when it finds an invalid character
+    def iter_tokens(self):
         # Checks if current character is a valid token type
         while self.current_char != None:
-            # Ignore spaces and tabs
-            if self.current_char in ' \t':
+            # Ignore spaces, tabs and new lines
+            if self.current_char in ' \t\r\n':
                 self.advance()
             
             # Find number tokens
             elif self.current_char in DIGITS:
-                tokens.append(self.make_number())
+                yield self.make_number()
             
             # Find letter tokens
             elif self.current_char in LETTERS:
-                tokens.append(self.make_identifier())
+                yield self.make_identifier()
             
             # Look for +, -, *, /, %, ^
             elif self.current_char == '+':
-                tokens.append(Token(TT_PLUS, pos_start=self.pos))
+                yield Token(TT_PLUS, start=self.pos.idx, source=self.source)
                 self.advance()
             elif self.current_char == '-':
-                tokens.append(Token(TT_MINUS, pos_start=self.pos))
+                yield Token(TT_MINUS, start=self.pos.idx, source=self.source)
                 self.advance()
             elif self.current_char == '*':
-                tokens.append(Token(TT_MULT, pos_start=self.pos))
+                yield Token(TT_MULT, start=self.pos.idx, source=self.source)
                 self.advance()
             elif self.current_char == '/':
-                tokens.append(Token(TT_DIV, pos_start=self.pos))
+                yield Token(TT_DIV, start=self.pos.idx, source=self.source)
                 self.advance()
             elif self.current_char == "%":
-                tokens.append(Token(TT_MOD, pos_start=self.pos))
+                yield Token(TT_MOD, start=self.pos.idx, source=self.source)
                 self.advance()
             elif self.current_char == "^":
-                tokens.append(Token(TT_POW, pos_start=self.pos))
+                yield Token(TT_POW, start=self.pos.idx, source=self.source)
                 self.advance()
             
             # Finds :
             elif self.current_char == ":":
-                tokens.append(Token(TT_EQU, pos_start=self.pos))
+                yield Token(TT_EQU, start=self.pos.idx, source=self.source)
                 self.advance()
             
             # Finds ( and )
             elif self.current_char == '(':
-                tokens.append(Token(TT_LPAREN, pos_start=self.pos))
+                yield Token(TT_LPAREN, start=self.pos.idx, source=self.source)
                 self.advance()
             elif self.current_char == ')':
-                tokens.append(Token(TT_RPAREN, pos_start=self.pos))
+                yield Token(TT_RPAREN, start=self.pos.idx, source=self.source)
                 self.advance()
             
             # If it finds an invalid token, throw an error
@@ -228,17 +353,16 @@ class Lexer:
                 pos_start = self.pos.copy()
                 char = self.current_char
                 self.advance()
-                return [], CharError(pos_start, self.pos, "Unexpected '" + char + "'")
+                raise LexError(CharError(pos_start, self.pos, "Unexpected '" + char + "'"))
         
-        # Puts all the tokens together and then return it
-        tokens.append(Token(TT_EOF, pos_start=self.pos))
-        return tokens, None
+        # Ends with the end of file token
+        yield Token(TT_EOF, start=self.pos.idx, source=self.source)
 
     # Used for making a number node
     def make_number(self):
         num_str = ''
         dot_count = 0
-        pos_start = self.pos.copy()
+        start = self.pos.idx
 
         # Puts each digit together into a number
         while self.current_char != None and self.current_char in DIGITS + '.':
@@ -253,86 +377,206 @@ class Lexer:
         
         # Return different things depending on the dot count in the number
         if dot_count == 0:
-            return Token(TT_INT, int(num_str), pos_start, self.pos)
+            return Token(TT_INT, int(num_str), start, self.pos.idx, self.source)
         else:
-            return Token(TT_FLOAT, float(num_str), pos_start, self.pos)
+            return Token(TT_FLOAT, float(num_str), start, self.pos.idx, self.source)
     
     # Used for making an indentifier node
     def make_identifier(self):
         id_str = ""
-        pos_start = self.pos.copy()
+        start = self.pos.idx
 
         while self.current_char != None and self.current_char in LETTERS_DIGITS + "_":
             id_str += self.current_char
             self.advance()
         
         tok_type = TT_KEYWORD if id_str in KEYWORDS else TT_IDENT
-        return Token(tok_type, id_str, pos_start, self.pos)
+        return Token(tok_type, id_str, start, self.pos.idx, self.source)
+
+
+
+# REGEX LEXER
+# Makes the same tokens as `Lexer`, but finds whole tokens at once with one regular expression
+
+TOKEN_REGEX = re.compile(r"""
+    (?P<space>[ \t\r\n]+)
+  | (?P<number>[0-9]+(?:\.[0-9]*)?)
+  | (?P<ident>[A-Za-z][A-Za-z0-9_]*)
+  | (?P<char>[-+*/%^:()])
+""", re.VERBOSE)
+
+# Token types of tokens that are one character long
+CHAR_TOKENS = {
+    "+": TT_PLUS,
+    "-": TT_MINUS,
+    "*": TT_MULT,
+    "/": TT_DIV,
+    "%": TT_MOD,
+    "^": TT_POW,
+    ":": TT_EQU,
+    "(": TT_LPAREN,
+    ")": TT_RPAREN,
+}
+
+# Lexing starts at the offset `start` of the text, `first_line` and `first_col` are the line and column of the file the text starts at
+class RegexLexer:
+    # Initialize
+    def __init__(self, fn, text, start=0, first_line=0, first_col=0):
+        self.fn = fn
+        self.text = text
+        self.start = start
+        self.first_line = first_line
+        self.first_col = first_col
+
+    # Make tokens
+    def make_tokens(self):
+        try:
+            return list(self.iter_tokens()), None
+        except LexError as error:
+            return [], error.error
+
+    # Make tokens one at a time
+    # Raises a LexError when it finds an invalid character
+    def iter_tokens(self):
+        text = self.text
+        source = Source(self.fn, text, self.first_line, self.first_col)
+        match = TOKEN_REGEX.match
+        idx = self.start
+
+        while idx < len(text):
+            found = match(text, idx)
+
+            # If it finds an invalid token, throw an error
+            if not found:
+                raise LexError(CharError(
+                    Position(idx, source), Position(idx + 1, source),
+                    "Unexpected '" + text[idx] + "'"
+                ))
+
+            kind = found.lastgroup
+            end = found.end()
+
+            if kind != "space":
+                lexeme = text[idx:end]
+
+                if kind == "number":
+                    if "." in lexeme:
+                        yield Token(TT_FLOAT, float(lexeme), idx, end, source)
+                    else:
+                        yield Token(TT_INT, int(lexeme), idx, end, source)
+                elif kind == "ident":
+                    tok_type = TT_KEYWORD if lexeme in KEYWORDS else TT_IDENT
+                    yield Token(tok_type, lexeme, idx, end, source)
+                else:
+                    yield Token(CHAR_TOKENS[lexeme], None, idx, end, source)
+
+            idx = end
+
+        yield Token(TT_EOF, None, idx, None, source)
 
 
 
 # NODES
+# Nodes only keep offsets into the code, see `Span` for their positions
 
 # Number node
-class NumberNode:
+class NumberNode(Span):
+    __slots__ = ("tok", )
+
     # Initialize
     def __init__(self, tok):
         self.tok = tok
-        self.pos_start = self.tok.pos_start
-        self.pos_end = self.tok.pos_end
+        self.start = self.tok.start
+        self.end = self.tok.end
+        self.source = self.tok.source
     
     # Represent
     def __repr__(self):
         return f'{self.tok}'
 
 # Variable access node
-class VarAccessNode:
+# `slot` is the slot of the variable in a symbol table, it is given by `Resolver`
+class VarAccessNode(Span):
+    __slots__ = ("var_name_tok", "slot")
+
     # Initialize
     def __init__(self, var_name_tok):
         self.var_name_tok = var_name_tok
+        self.slot = None
 
         # Position
-        self.pos_start = self.var_name_tok.pos_start
-        self.pos_end = self.var_name_tok.pos_end
+        self.start = self.var_name_tok.start
+        self.end = self.var_name_tok.end
+        self.source = self.var_name_tok.source
 
 # Variable assign node
-class VarAssignNode:
+# `slot` is the slot of the variable in a symbol table, it is given by `Resolver`
+class VarAssignNode(Span):
+    __slots__ = ("var_name_tok", "value_node", "slot")
+
     # Initialize
     def __init__(self, var_name_tok, value_node):
         self.var_name_tok = var_name_tok
         self.value_node = value_node
+        self.slot = None
 
         # Position
-        self.pos_start = self.var_name_tok.pos_start
-        self.pos_end = self.value_node.pos_end
+        self.start = self.var_name_tok.start
+        self.end = self.value_node.end
+        self.source = self.var_name_tok.source
+
+# Get the node whose position the value of a node has
+# An assignment has the position of the value it assigns
+def span_node(node):
+    while isinstance(node, VarAssignNode):
+        node = node.value_node
+    return node
 
 # Binary operator node
-class BinOpNode:
+class BinOpNode(Span):
+    __slots__ = ("left_node", "op_tok", "right_node")
+
     # Initialize
     def __init__(self, left_node, op_tok, right_node):
         self.left_node = left_node
         self.op_tok = op_tok
         self.right_node = right_node
-        self.pos_start = self.left_node.pos_start
-        self.pos_end = self.right_node.pos_end
+        self.start = self.left_node.start
+        self.end = self.right_node.end
+        self.source = self.left_node.source
 
     # Represent
     def __repr__(self):
         return f'({self.left_node}, {self.op_tok}, {self.right_node})'
 
 # Unary operator node
-class UnaryOpNode:
+class UnaryOpNode(Span):
+    __slots__ = ("op_tok", "node")
+
     # Initialize
     def __init__(self, op_tok, node):
         self.op_tok = op_tok
         self.node = node
-        self.pos_start = self.op_tok.pos_start
-        self.pos_end = node.pos_end
+        self.start = self.op_tok.start
+        self.end = node.end
+        self.source = self.op_tok.source
 
     # Represent
     def __repr__(self):
         return f'({self.op_tok}, {self.node})'
 
+# Makes the nodes for the parser
+# Another builder, like `FlatTreeBuilder`, can be given to the parser to store the tree in another way;
+# the parser only passes what the builder returns back to it
+class NodeBuilder:
+    number = NumberNode
+    var_access = VarAccessNode
+    var_assign = VarAssignNode
+    bin_op = BinOpNode
+    unary_op = UnaryOpNode
+
+NODE_BUILDER = NodeBuilder()
+
 
 
 # PARSE RESULT
@@ -340,6 +584,8 @@ class UnaryOpNode:
 
 # ParseResult class
 class ParseResult:
+    __slots__ = ("error", "node", "advance_count")
+
     # Initialize
     def __init__(self):
         self.error = None
@@ -376,16 +622,21 @@ class ParseResult:
 # Parser class
 class Parser:
     # Init
-    def __init__(self, tokens):
-        self.tokens = tokens
+    # `tokens` can be a list or a stream like `Lexer.iter_tokens()`, only the current token is kept
+    # The nodes are made by `builder` (see `NodeBuilder`)
+    def __init__(self, tokens, builder=None):
+        self.builder = NODE_BUILDER if builder is None else builder
+        self.tokens = iter(tokens)
         self.tok_idx = -1
+        self.current_tok = None
         self.advance()
     
     # Advance
+    # Stays on the end of file token once it gets there
     def advance(self, ):
-        self.tok_idx += 1
-        if self.tok_idx < len(self.tokens):
-            self.current_tok = self.tokens[self.tok_idx]
+        if self.current_tok is None or self.current_tok.type != TT_EOF:
+            self.tok_idx += 1
+            self.current_tok = next(self.tokens)
         return self.current_tok
 
     # Parse the user's code
@@ -412,13 +663,13 @@ class Parser:
         if tok.type in (TT_INT, TT_FLOAT):
             res.register_advancement()
             self.advance()
-            return res.success(NumberNode(tok))
+            return res.success(self.builder.number(tok))
         
         # Identifiers
         elif tok.type == TT_IDENT:
             res.register_advancement()
             self.advance()
-            return res.success(VarAccessNode(tok))
+            return res.success(self.builder.var_access(tok))
         
         # Parenthesis
         elif tok.type == TT_LPAREN:
@@ -459,7 +710,7 @@ class Parser:
             factor = res.register(self.factor())
             if res.error:
                 return res
-            return res.success(UnaryOpNode(tok, factor))
+            return res.success(self.builder.unary_op(tok, factor))
         
         # If no number is found, an error is thrown
         return self.power()
@@ -503,7 +754,7 @@ class Parser:
             expr = res.register(self.expr())
             if res.error:
                 return res
-            return res.success(VarAssignNode(var_name, expr))
+            return res.success(self.builder.var_assign(var_name, expr))
         
         node = res.register(self.bin_op(self.term, (TT_PLUS, TT_MINUS)))
 
@@ -536,16 +787,175 @@ class Parser:
             right = res.register(func_b())
             if res.error:
                 return res
-            left = BinOpNode(left, op_tok, right)
+            left = self.builder.bin_op(left, op_tok, right)
         
         return res.success(left)
 
 
 
+# PRECEDENCE CLIMBING PARSER
+# Makes the same tree as `Parser`, but uses its own stacks instead of calling itself,
+# so deeply nested code does not hit the recursion limit
+
+# Binding power of each operator; unary operators are between `*` and `^`
+BINARY_PRECEDENCE = {
+    TT_PLUS: 1,
+    TT_MINUS: 1,
+    TT_MULT: 2,
+    TT_DIV: 2,
+    TT_MOD: 2,
+    TT_POW: 4,
+}
+UNARY_PRECEDENCE = 3
+
+# Kinds of entries on the operator stack
+OP_ENTRY_BINARY = 0
+OP_ENTRY_UNARY = 1
+OP_ENTRY_PAREN = 2
+OP_ENTRY_DEF = 3
+
+class ClimbingParser(Parser):
+    # Parse the user's code
+    def parse(self):
+        res = ParseResult()
+        operands = []
+        ops = []
+        open_parens = 0
+
+        number = self.builder.number
+        var_access = self.builder.var_access
+
+        # True when an operand is next, and when nothing of the current expression is read yet
+        want_operand = True
+        expr_start = True
+
+        while True:
+            tok = self.current_tok
+            tok_type = tok.type
+
+            if want_operand:
+                # Variable assignment (only at the start of an expression)
+                if expr_start and tok.matches(TT_KEYWORD, "def"):
+                    self.advance()
+                    if self.current_tok.type != TT_IDENT:
+                        return res.failure(SyntaxError(
+                            self.current_tok.pos_start, self.current_tok.pos_end,
+                            "Expected identifier"
+                        ))
+                    var_name = self.current_tok
+                    self.advance()
+                    if self.current_tok.type != TT_EQU:
+                        return res.failure(SyntaxError(
+                            self.current_tok.pos_start, self.current_tok.pos_end,
+                            "Expected ':'"
+                        ))
+                    self.advance()
+                    ops.append((OP_ENTRY_DEF, var_name))
+                    continue
+
+                # Numbers and identifiers
+                if tok_type in (TT_INT, TT_FLOAT):
+                    operands.append(number(tok))
+                elif tok_type == TT_IDENT:
+                    operands.append(var_access(tok))
+
+                # Parenthesis
+                elif tok_type == TT_LPAREN:
+                    self.advance()
+                    ops.append((OP_ENTRY_PAREN, ))
+                    open_parens += 1
+                    expr_start = True
+                    continue
+
+                # Unary operators
+                elif tok_type in (TT_PLUS, TT_MINUS, TT_MOD):
+                    self.advance()
+                    ops.append((OP_ENTRY_UNARY, tok))
+                    expr_start = False
+                    continue
+
+                # Nothing that can start a value was found
+                elif expr_start:
+                    return res.failure(SyntaxError(
+                        tok.pos_start, tok.pos_end,
+                        "Expected 'def', number, identifier, '+', '-', or '('"
+                    ))
+                else:
+                    return res.failure(SyntaxError(
+                        tok.pos_start, tok.pos_end,
+                        "Expected a number, identifier, '+', '-', or '('"
+                    ))
+
+                self.advance()
+                want_operand = False
+                expr_start = False
+                continue
+
+            # Binary operators
+            if tok_type in BINARY_PRECEDENCE:
+                prec = BINARY_PRECEDENCE[tok_type]
+
+                # `^` is right associative and binds tighter than everything, so it never reduces
+                if tok_type != TT_POW:
+                    self.reduce(operands, ops, prec)
+                self.advance()
+                ops.append((OP_ENTRY_BINARY, tok))
+                want_operand = True
+                continue
+
+            # Closing parenthesis
+            if tok_type == TT_RPAREN and open_parens:
+                self.reduce(operands, ops, 0)
+                ops.pop()
+                open_parens -= 1
+                self.advance()
+                continue
+
+            # Anything else ends the code, or the innermost parenthesis
+            if open_parens:
+                return res.failure(SyntaxError(
+                    tok.pos_start, tok.pos_end,
+                    "Expected ')'"
+                ))
+            if tok_type != TT_EOF:
+                return res.failure(SyntaxError(
+                    tok.pos_start, tok.pos_end,
+                    "Expected '+', '-', '*', '/', '%', or '^'"
+                ))
+            self.reduce(operands, ops, 0)
+            return res.success(operands[0])
+
+    # Combine operators on the stack with their operands
+    # Stops at an operator that binds less tightly than `prec`; `prec` 0 also combines `def` but stops at '('
+    def reduce(self, operands, ops, prec):
+        builder = self.builder
+        while ops:
+            entry = ops[-1]
+            kind = entry[0]
+
+            if kind == OP_ENTRY_BINARY:
+                if BINARY_PRECEDENCE[entry[1].type] < prec:
+                    return
+                right = operands.pop()
+                operands[-1] = builder.bin_op(operands[-1], entry[1], right)
+            elif kind == OP_ENTRY_UNARY:
+                if UNARY_PRECEDENCE < prec:
+                    return
+                operands[-1] = builder.unary_op(entry[1], operands[-1])
+            elif kind == OP_ENTRY_DEF and prec == 0:
+                operands[-1] = builder.var_assign(entry[1], operands[-1])
+            else:
+                return
+            ops.pop()
+
+
+
 # RUNTIME RESULT
 # Keeps track of the current result and errors
 
 class RTResult:
+    __slots__ = ("value", "error")
+
     def __init__(self):
         self.value = None
         self.error = None
@@ -569,76 +979,46 @@ class RTResult:
 
 
 # VALUES
-# Handles the different types of values in the language
-
-class Number:
-    def __init__(self, value):
-        self.value = value
-        self.set_pos()
-        self.set_context()
-    
-    # Set the position
-    def set_pos(self, pos_start=None, pos_end=None):
-        self.pos_start = pos_start
-        self.pos_end = pos_end
-        return self
-    
-    # Set the context
-    def set_context(self, context=None):
-        self.context = context
-        return self
-    
-    # Add numbers
-    def added_to(self, other):
-        if isinstance(other, Number):
-            return Number(self.value + other.value).set_context(self.context), None
-    
-    # Subtract numbers
-    def subbed_by(self, other):
-        if isinstance(other, Number):
-            return Number(self.value - other.value).set_context(self.context), None
-    
-    # Multiply numbers
-    def multed_by(self, other):
-        if isinstance(other, Number):
-            return Number(self.value * other.value).set_context(self.context), None
-    
-    # Divide numbers
-    def dived_by(self, other):
-        if isinstance(other, Number):
-            if other.value == 0:
-                return None, RTError(
-                    other.pos_start, other.pos_end,
-                    "Cannot divide by zero",
-                    self.context
-                )
-            return Number(self.value / other.value).set_context(self.context), None
-    
-    # Modulus numbers
-    def moded_by(self, other):
-        if isinstance(other, Number):
-            if other.value == 0:
-                return None, RTError(
-                    other.pos_start, other.pos_end,
-                    "Cannot divide by zero",
-                    self.context
-                )
-            return Number(self.value % other.value).set_context(self.context), None
-    
-    # Exponentation
-    def powed_by(self, other):
-        if isinstance(other, Number):
-            return Number(self.value ** other.value).set_context(self.context), None
-    
-    # Copy
-    def copy(self):
-        copy = Number(self.value)
-        copy.set_pos(self.pos_start, self.pos_end)
-        copy.set_context(self.context)
-        return copy
-    
-    def __repr__(self):
-        return str(self.value)
+# Values are plain Python ints and floats, so arithmetic does not make new objects
+# Positions and contexts are only looked up when an error is made
+
+# Python function for each binary operator token type
+BINARY_FUNCTIONS = {
+    TT_PLUS: operator.add,
+    TT_MINUS: operator.sub,
+    TT_MULT: operator.mul,
+    TT_DIV: operator.truediv,
+    TT_MOD: operator.mod,
+    TT_POW: operator.pow,
+}
+
+# Make the error for dividing by zero
+# It points at the right side of the division
+def division_error(right_node, context):
+    node = span_node(right_node)
+    return RTError(node.pos_start, node.pos_end, "Cannot divide by zero", context)
+
+# Integers with fewer bits than this always have fewer digits than Python's smallest limit on turning integers into text
+JSON_SAFE_INT_BITS = 2000
+
+# Turn a value into one that `json.dumps` can write as valid JSON
+# JSON has no complex numbers, infinities or NaN, and Python does not turn integers with more than
+# `sys.get_int_max_str_digits()` digits into text, so those values become strings
+# `decimal` has no limit on digits, so it writes the big integers
+def json_value(value):
+    value_type = type(value)
+    if value_type is int:
+        if value.bit_length() > JSON_SAFE_INT_BITS:
+            try:
+                str(value)
+            except ValueError:
+                return str(decimal.Decimal(value))
+        return value
+    if value_type is float:
+        return value if math.isfinite(value) else str(value)
+    if value_type is complex:
+        return str(value)
+    return value
 
 
 
@@ -651,31 +1031,210 @@ class Context:
         self.parent_entry_pos = parent_entry_pos
         self.symbol_table = None
 
+    # Errors keep their context for the traceback, but the symbol table is not sent when they are pickled
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["symbol_table"] = None
+        return state
+
 
 
 # SYMBOL TABLE
 # Keep track of variable names and their values
+# Every variable name gets a slot number, and symbol tables keep their values in a list indexed by slot
+# Slots of names that nothing uses anymore are given to new names (see `free_slots`), so slot numbers stay small
+
+# Slot of each variable name, and the name of each slot (None for a free slot)
+# Slots are only the same inside one process
+NAME_SLOTS = {}
+SLOT_NAMES = []
+name_slots_lock = threading.Lock()
+
+# Free slots, the smallest one is given first
+free_slot_heap = []
+
+# Slots that are never freed, because something that is not in `slot_users` keeps them,
+# like a tree given to `Resolver` by hand
+pinned_slots = set()
+
+# Symbol tables, programs and compiled code that are alive; each one has a `used_slots` method
+slot_users = weakref.WeakSet()
+
+# Slots are freed by `compile_program` when more than this many slots were given out since they were last freed
+MIN_NEW_SLOTS = 4096
+new_slots = 0
+new_slots_limit = MIN_NEW_SLOTS
+
+# Get the slot of a variable name, giving it a new slot if it does not have one yet
+# With `pin`, the slot is never freed
+def name_slot(name, pin=False):
+    slot = NAME_SLOTS.get(name)
+    if slot is None or pin:
+        global new_slots
+        with name_slots_lock:
+            slot = NAME_SLOTS.get(name)
+            if slot is None:
+                if free_slot_heap:
+                    slot = heapq.heappop(free_slot_heap)
+                    SLOT_NAMES[slot] = name
+                else:
+                    slot = len(SLOT_NAMES)
+                    SLOT_NAMES.append(name)
+                NAME_SLOTS[name] = slot
+                new_slots += 1
+            if pin:
+                pinned_slots.add(slot)
+    return slot
+
+# Never free some slots
+def pin_slots(slots):
+    with name_slots_lock:
+        pinned_slots.update(slots)
+
+# Get the slots used by the variable nodes of a tree
+def tree_slots(node):
+    slots = set()
+    seen = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        node_type = type(node)
+        if node_type is VarAccessNode or node_type is VarAssignNode:
+            if node.slot is not None:
+                slots.add(node.slot)
+        for field in NODE_CHILDREN[node_type]:
+            child = getattr(node, field)
+            # Shared subtrees are only walked once
+            if id(child) not in seen:
+                seen.add(id(child))
+                stack.append(child)
+    return slots
+
+# Free the slots of names that no symbol table, program or compiled code uses, so new names get them
+# A slot can be in a tree that is being made or run and is not in any of those yet,
+# so this must not run while other threads compile or run code; `compile_program` only runs it when there is one thread
+# Returns the number of slots freed
+def free_slots():
+    global new_slots, new_slots_limit
+    with name_slots_lock:
+        used = set(pinned_slots)
+        for user in list(slot_users):
+            used.update(user.used_slots())
+
+        freed = 0
+        for slot, name in enumerate(SLOT_NAMES):
+            if name is not None and slot not in used:
+                del NAME_SLOTS[name]
+                SLOT_NAMES[slot] = None
+                freed += 1
+
+        # Free slots at the end are removed, so the list does not stay at its biggest size
+        while SLOT_NAMES and SLOT_NAMES[-1] is None:
+            SLOT_NAMES.pop()
+        free_slot_heap[:] = [slot for slot, name in enumerate(SLOT_NAMES) if name is None]
+
+        new_slots = 0
+        new_slots_limit = max(MIN_NEW_SLOTS, len(NAME_SLOTS))
+    return freed
+
+# Slots under this are kept in a list, bigger ones in a dict, so a table with a few variables in big slots stays small
+DENSE_SLOTS = 1024
 
 class SymbolTable:
     # Initialize
+    # `None` in a slot means the variable is not defined in this table
     def __init__(self):
-        self.symbols = {}
+        self.values = []
+        self.sparse = {}
         self.parent = None
+        slot_users.add(self)
     
-    # Get a variable
+    # Get a variable by name
+    # Used for names that were not resolved, like the ones the REPL adds
     def get(self, name):
-        value = self.symbols.get(name, None)
-        if value == None and self.parent:
-            return self.parent.get(name)
-        return value
+        slot = NAME_SLOTS.get(name)
+        if slot is None:
+            return None
+        return self.get_slot(slot)
+
+    # Get a variable by slot, looking in the parent tables if it is not defined here
+    def get_slot(self, slot):
+        table = self
+        while table is not None:
+            values = table.values
+            if slot < len(values):
+                value = values[slot]
+                if value is not None:
+                    return value
+            elif table.sparse:
+                value = table.sparse.get(slot)
+                if value is not None:
+                    return value
+            table = table.parent
+        return None
     
-    # Set a variable
+    # Set a variable by name
     def set(self, name, value):
-        self.symbols[name] = value
+        self.set_slot(name_slot(name), value)
+
+    # Set a variable by slot
+    def set_slot(self, slot, value):
+        values = self.values
+        if slot < len(values):
+            values[slot] = value
+        elif slot < DENSE_SLOTS:
+            values.extend([None] * (slot + 1 - len(values)))
+            values[slot] = value
+        else:
+            self.sparse[slot] = value
     
     # Remove a variable
     def remove(self, name):
-        del self.symbols[name]
+        slot = NAME_SLOTS.get(name)
+        if slot is not None and slot < len(self.values) and self.values[slot] is not None:
+            self.values[slot] = None
+        elif slot is not None and slot in self.sparse:
+            del self.sparse[slot]
+        else:
+            raise KeyError(name)
+
+    # Remove every variable
+    def clear(self):
+        self.values.clear()
+        self.sparse.clear()
+
+    # Get the slots of the variables defined in this table
+    def used_slots(self):
+        return [slot for slot, value in enumerate(self.values) if value is not None] + list(self.sparse)
+
+    # Get the variables defined in this table, without the parent tables, by name
+    # Slots are only the same inside one process, so names are used to save the variables
+    def as_dict(self):
+        variables = {SLOT_NAMES[slot]: value for slot, value in enumerate(self.values) if value is not None}
+        for slot, value in self.sparse.items():
+            variables[SLOT_NAMES[slot]] = value
+        return variables
+
+# Symbol table that cannot be changed after it is frozen
+# Used as the parent of other tables, which get their own copy of a variable when it is set
+class FrozenSymbolTable(SymbolTable):
+    # Initialize
+    def __init__(self, symbols):
+        super().__init__()
+        for name, value in symbols.items():
+            super().set_slot(name_slot(name), value)
+
+    # Set a variable by slot
+    def set_slot(self, slot, value):
+        raise Exception("Cannot change a frozen symbol table")
+
+    # Remove a variable
+    def remove(self, name):
+        raise Exception("Cannot change a frozen symbol table")
+
+    # Remove every variable
+    def clear(self):
+        raise Exception("Cannot change a frozen symbol table")
 
 
 
@@ -683,11 +1242,23 @@ class SymbolTable:
 # INTERPRETER
 
 class Interpreter:
+    # Visit method of each node type, found the first time the node type is visited
+    # Every subclass gets its own table, so it can have its own visit methods
+    visit_methods = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.visit_methods = {}
+
     # Visit
     def visit(self, node, context):
-        method_name = f"visit_{type(node).__name__}"
-        method = getattr(self, method_name, self.no_visit_method)
-        return method(node, context)
+        method = self.visit_methods.get(type(node))
+        if method is None:
+            method = getattr(type(self), f"visit_{type(node).__name__}", None)
+            if method is None:
+                return self.no_visit_method(node, context)
+            self.visit_methods[type(node)] = method
+        return method(self, node, context)
     
     # Throws error if specified `visit_[NODE]` method doesn't exist
     def no_visit_method(self, node, context):
@@ -696,29 +1267,24 @@ class Interpreter:
     # Visit each node type
     # Number node
     def visit_NumberNode(self, node, context):
-        return RTResult().success(
-            Number(node.tok.value).set_context(context).set_pos(node.pos_start, node.pos_end)
-        )
+        return RTResult().success(node.tok.value)
     
     def visit_VarAccessNode(self, node, context):
         res = RTResult()
-        var_name = node.var_name_tok.value
-        value = context.symbol_table.get(var_name)
+        value = context.symbol_table.get_slot(node.slot)
 
         # Checks if it is defined yet
-        if not value:
+        if value is None:
             return res.failure(RTError(
                 node.pos_start, node.pos_end,
-                f"'{var_name}' is not defined",
+                f"'{node.var_name_tok.value}' is not defined",
                 context
             ))
         
-        value = value.copy().set_pos(node.pos_start, node.pos_end)
         return res.success(value)
     
     def visit_VarAssignNode(self, node, context):
         res = RTResult()
-        var_name = node.var_name_tok.value
         value = res.register(self.visit(node.value_node, context))
 
         # Checks for errors
@@ -726,7 +1292,7 @@ class Interpreter:
             return res
         
         # If no error, set a variable
-        context.symbol_table.set(var_name, value)
+        context.symbol_table.set_slot(node.slot, value)
         
         # Return
         return res.success(value)
@@ -741,25 +1307,12 @@ class Interpreter:
         if res.error:
             return res
 
-        # Checks if the operator is valid
-        if node.op_tok.type == TT_PLUS:
-            result, error = left.added_to(right)
-        elif node.op_tok.type == TT_MINUS:
-            result, error = left.subbed_by(right)
-        elif node.op_tok.type == TT_MULT:
-            result, error = left.multed_by(right)
-        elif node.op_tok.type == TT_DIV:
-            result, error = left.dived_by(right)
-        elif node.op_tok.type == TT_MOD:
-            result, error = left.moded_by(right)
-        elif node.op_tok.type == TT_POW:
-            result, error = left.powed_by(right)
-        
-        # Checks if there is an error
-        if error:
-            return res.failure(error)
-        else:
-            return res.success(result.set_pos(node.pos_start, node.pos_end))
+        # Checks for division by zero
+        op = node.op_tok.type
+        if right == 0 and op in (TT_DIV, TT_MOD):
+            return res.failure(division_error(node.right_node, context))
+
+        return res.success(BINARY_FUNCTIONS[op](left, right))
     
     # Unary operator node
     def visit_UnaryOpNode(self, node, context):
@@ -767,49 +1320,2207 @@ class Interpreter:
         number = res.register(self.visit(node.node, context))
         if res.error:
             return res
-        
-        error = None
 
         # Checks plus and minus operators
         if node.op_tok.type == TT_MINUS:
-            number, error = number.multed_by(Number(-1))
+            number = -number
         
-        if error:
-            return res.failure(error)
+        return res.success(number)
+
+
+
+# BUDGETS
+# Limits on how much one run can do, so one bad piece of code cannot take the whole process
+
+# Steps between checks of the deadline
+DEADLINE_CHECK_STEPS = 256
+
+# Limits of a run, None means no limit
+# `max_steps` is the number of nodes that run, `timeout` is in seconds from when the program starts running,
+# `max_bits` is the biggest integer that `^`, `*` and `%` can make
+class Budget:
+    __slots__ = ("max_steps", "timeout", "max_bits")
+
+    # Initialize
+    def __init__(self, max_steps=None, timeout=None, max_bits=None):
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.max_bits = max_bits
+
+# Exponents with more bits than this are too big for a float, so their estimate is worked out with integers
+MAX_FLOAT_EXPONENT_BITS = 1000
+
+# Estimated number of bits of the result of an operator, worked out without doing the operation
+# Only integers can get big enough to be slow; floats stop at about 1e308
+def estimate_bits(op, left, right):
+    if type(left) is not int or type(right) is not int:
+        return 0
+    if op == TT_POW:
+        if right <= 0 or -1 <= left <= 1:
+            return 0
+        # `left` has at least `bit_length() - 1` bits, so this is a lower bound that is already far over any limit
+        if right.bit_length() > MAX_FLOAT_EXPONENT_BITS:
+            return right * (abs(left).bit_length() - 1) + 1
+        return int(right * math.log2(abs(left))) + 1
+    if op == TT_MULT:
+        return left.bit_length() + right.bit_length()
+    if op == TT_MOD:
+        return max(left.bit_length(), right.bit_length())
+    return 0
+
+# Make the error for a result that would be too big
+# Like division errors, it points at the right side of the operator
+def size_error(bits, budget, right_node, context):
+    node = span_node(right_node)
+    return SizeLimitError(
+        node.pos_start, node.pos_end,
+        f"Result would have about {bits} bits, the limit is {budget.max_bits}",
+        context
+    )
+
+# Make the error for a run that took too long
+def time_error(node, budget, context):
+    return TimeLimitError(
+        node.pos_start, node.pos_end,
+        f"Program ran longer than {budget.timeout} seconds",
+        context
+    )
+
+# Check the number of steps of a program before it runs
+# Every node runs at most once, because there are no loops, so the steps are known before the run
+# Returns the error at the node that would go over the limit, or None
+def check_steps(node, node_count, budget, context):
+    if budget.max_steps is None or node_count <= budget.max_steps:
+        return None
+
+    # Nodes are visited parent first, then from left to right
+    stack = [node]
+    step = 0
+    while True:
+        node = stack.pop()
+        step += 1
+        if step > budget.max_steps:
+            return StepLimitError(
+                node.pos_start, node.pos_end,
+                f"Program has {node_count} steps, the limit is {budget.max_steps}",
+                context
+            )
+        for field in reversed(NODE_CHILDREN[type(node)]):
+            stack.append(getattr(node, field))
+
+# Interpreter that stops when the run takes too long or a number gets too big
+class LimitedInterpreter(Interpreter):
+    # Initialize
+    # `deadline` is a `time.monotonic` time
+    def __init__(self, budget, deadline):
+        self.budget = budget
+        self.deadline = deadline
+        self.steps = 0
+
+    # Visit
+    def visit(self, node, context):
+        self.steps += 1
+        if self.deadline is not None and self.steps % DEADLINE_CHECK_STEPS == 0:
+            if time.monotonic() > self.deadline:
+                return RTResult().failure(time_error(node, self.budget, context))
+        return super().visit(node, context)
+
+    # Binary operator node
+    # The size of the result is checked before the operator runs
+    def visit_BinOpNode(self, node, context):
+        if self.budget.max_bits is None or node.op_tok.type not in (TT_POW, TT_MULT, TT_MOD):
+            return super().visit_BinOpNode(node, context)
+
+        res = RTResult()
+        left = res.register(self.visit(node.left_node, context))
+        if res.error:
+            return res
+        right = res.register(self.visit(node.right_node, context))
+        if res.error:
+            return res
+
+        op = node.op_tok.type
+        bits = estimate_bits(op, left, right)
+        if bits > self.budget.max_bits:
+            return res.failure(size_error(bits, self.budget, node.right_node, context))
+
+        # Checks for division by zero
+        if right == 0 and op == TT_MOD:
+            return res.failure(division_error(node.right_node, context))
+
+        return res.success(BINARY_FUNCTIONS[op](left, right))
+
+
+
+# OPTIMIZER
+# Simplifies the tree before it runs
+
+# Child node fields of each node type
+NODE_CHILDREN = {
+    NumberNode: (),
+    VarAccessNode: (),
+    VarAssignNode: ("value_node", ),
+    BinOpNode: ("left_node", "right_node"),
+    UnaryOpNode: ("node", ),
+}
+
+# Count the nodes in a tree
+def count_nodes(node):
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        for field in NODE_CHILDREN[type(node)]:
+            stack.append(getattr(node, field))
+    return count
+
+# Get the number of levels of a tree
+def tree_depth(node):
+    depth = 0
+    stack = [(node, 1)]
+    while stack:
+        node, level = stack.pop()
+        depth = max(depth, level)
+        for field in NODE_CHILDREN[type(node)]:
+            stack.append((getattr(node, field), level + 1))
+    return depth
+
+# Largest integer result (in bits) that constant folding will make
+FOLD_MAX_BITS = 4096
+
+# Size limit the optimizer keeps to for runs with a budget, or None
+# With a limit, `^`, `*` and `%` that the run would check are not folded over it or removed,
+# so the run gives the same `SizeLimitError` as without the optimizer
+# The limit changes the tree, so it is a part of the cache key of the program
+def fold_limit(budget):
+    return None if budget is None else budget.max_bits
+
+# Returns the tree as indented text, one node per line
+def dump_tree(node):
+    lines = []
+    stack = [(node, 0)]
+
+    while stack:
+        node, depth = stack.pop()
+        node_type = type(node)
+        if node_type is NumberNode:
+            label = f"{node.tok.value!r}"
+        elif node_type is VarAccessNode:
+            label = node.var_name_tok.value
+        elif node_type is VarAssignNode:
+            label = f"def {node.var_name_tok.value}"
         else:
-            return res.success(number.set_pos(node.pos_start, node.pos_end))
+            label = node.op_tok.type
+        lines.append(f"{'  ' * depth}{node_type.__name__} {label}")
 
+        for field in reversed(NODE_CHILDREN[node_type]):
+            stack.append((getattr(node, field), depth + 1))
 
+    return "\n".join(lines)
 
-# RUN
-# Run the user's code
+# Parent class of all optimizer passes
+# A pass has a `visit_[NODE]` method for each node type it changes
+class OptimizerPass:
+    name = "pass"
+    level = 1
 
-global_symbol_table = SymbolTable()
-global_symbol_table.set("null", Number(0))
+    # Initialize
+    # `max_bits` is the size limit of the runs (see `fold_limit`)
+    def __init__(self, max_bits=None):
+        self.max_bits = max_bits
+
+    # Visit method of each node type, None for node types the pass does not change
+    # Every subclass gets its own table, made once when the class is made
+    visit_methods = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.visit_methods = {
+            node_type: getattr(cls, f"visit_{node_type.__name__}", None) for node_type in NODE_CHILDREN
+        }
+
+    # Visit a node whose children were already optimized
+    # `divisor` is true if the node is the right side of a division, so the position of its value is used by errors
+    def visit(self, node, divisor):
+        method = self.visit_methods.get(type(node))
+        if method is None:
+            return node
+        return method(self, node, divisor)
+
+    # Replace a node with another node
+    def replace(self, node, new_node, divisor):
+        if not divisor:
+            return new_node
+
+        # Variables have their own position for errors, so they cannot take a new one
+        if type(new_node) in (VarAccessNode, VarAssignNode):
+            return node
+
+        # Keep the position of the value for the "Cannot divide by zero" error
+        new_node = copy.copy(new_node)
+        new_node.start = node.start
+        new_node.end = node.end
+        return new_node
+
+    # Make a number node in the place of a node
+    def number(self, node, value):
+        tok_type = TT_INT if type(value) is int else TT_FLOAT
+        return NumberNode(Token(tok_type, value, node.start, node.end, node.source))
+
+# Calculates parts of the tree that only use numbers
+class ConstantFolding(OptimizerPass):
+    name = "constant-folding"
+    level = 1
 
-def run(fn, text):
-    # Generate tokens
-    lexer = Lexer(fn, text)
-    tokens, error = lexer.make_tokens()
-    if error:
-        return None, error
-    
-    # Generate AST
-    parser = Parser(tokens)
-    ast = parser.parse()
-    if ast.error:
-        return None, ast.error
-    
-    # Run the actual code
-    interpreter = Interpreter()
-    context = Context("<program>")
-    context.symbol_table = global_symbol_table
-    result = interpreter.visit(ast.node, context)
+    # Binary operator node
+    def visit_BinOpNode(self, node, divisor):
+        left, right = node.left_node, node.right_node
+        if type(left) is not NumberNode or type(right) is not NumberNode:
+            return node
+        a, b = left.tok.value, right.tok.value
+        op = node.op_tok.type
+
+        # Division by zero has to stay, so the error happens when the code runs
+        if op in (TT_DIV, TT_MOD) and b == 0:
+            return node
+
+        # Do not make giant numbers at compile time, or numbers the run would stop at for being too big
+        if op in (TT_POW, TT_MULT, TT_MOD):
+            limit = FOLD_MAX_BITS if self.max_bits is None else min(self.max_bits, FOLD_MAX_BITS)
+            if estimate_bits(op, a, b) > limit:
+                return node
+
+        try:
+            value = BINARY_FUNCTIONS[op](a, b)
+        except ArithmeticError:
+            return node
+        if type(value) not in (int, float):
+            return node
+        return self.number(node, value)
+
+    # Unary operator node
+    def visit_UnaryOpNode(self, node, divisor):
+        if type(node.node) is not NumberNode:
+            return node
+        value = node.node.tok.value
+        if node.op_tok.type == TT_MINUS:
+            value = -value
+        return self.number(node, value)
+
+# Removes operations that do not change the value
+# `x + 0` is removed too, even though `-0.0 + 0` is `0.0`
+class AlgebraicIdentities(OptimizerPass):
+    name = "algebraic-identities"
+    level = 2
+
+    # Binary operator node
+    def visit_BinOpNode(self, node, divisor):
+        left, right = node.left_node, node.right_node
+        if type(left) is not NumberNode and type(right) is not NumberNode:
+            return node
+        op = node.op_tok.type
+
+        # x + 0, x - 0, 0 + x
+        if self.is_int(right, 0) and op in (TT_PLUS, TT_MINUS):
+            return self.replace(node, left, divisor)
+        if self.is_int(left, 0) and op == TT_PLUS:
+            return self.replace(node, right, divisor)
+
+        # x * 1, x ^ 1, 1 * x
+        # With a size limit, the run checks the size of these, so they stay
+        if self.max_bits is not None:
+            return node
+        if self.is_int(right, 1) and op in (TT_MULT, TT_POW):
+            return self.replace(node, left, divisor)
+        if self.is_int(left, 1) and op == TT_MULT:
+            return self.replace(node, right, divisor)
+
+        return node
+
+    # Unary operator node
+    def visit_UnaryOpNode(self, node, divisor):
+        # -(-x)
+        if node.op_tok.type == TT_MINUS:
+            inner = node.node
+            if type(inner) is UnaryOpNode and inner.op_tok.type == TT_MINUS:
+                return self.replace(node, inner.node, divisor)
+            return node
+
+        # +x
+        return self.replace(node, node.node, divisor)
+
+    # Checks if a node is a certain integer
+    def is_int(self, node, value):
+        return type(node) is NumberNode and type(node.tok.value) is int and node.tok.value == value
+
+# Replaces slow operations with faster ones
+class StrengthReduction(OptimizerPass):
+    name = "strength-reduction"
+    level = 2
+
+    # Binary operator node
+    def visit_BinOpNode(self, node, divisor):
+        right = node.right_node
+
+        # x ^ 2 -> x * x
+        # With a size limit, `x * x` could go over it where `x ^ 2` does not, so it stays
+        if (self.max_bits is None and node.op_tok.type == TT_POW and type(node.left_node) is VarAccessNode
+                and type(right) is NumberNode and type(right.tok.value) is int and right.tok.value == 2):
+            op_tok = Token(TT_MULT, None, node.op_tok.start, node.op_tok.end, node.op_tok.source)
+            new_node = BinOpNode(node.left_node, op_tok, node.left_node)
+            new_node.start = node.start
+            new_node.end = node.end
+            return new_node
+
+        return node
+
+# All the optimizer passes, in the order they run
+OPTIMIZER_PASSES = [ConstantFolding, AlgebraicIdentities, StrengthReduction]
+
+class Optimizer:
+    # Initialize
+    # Level 0 does nothing, level 1 folds constants and level 2 runs every pass
+    # If `dump` is a file, the tree is written to it before and after each pass
+    # `max_bits` is given to the passes (see `fold_limit`)
+    def __init__(self, level=1, passes=None, dump=None, max_bits=None):
+        self.level = level
+        self.passes = OPTIMIZER_PASSES if passes is None else passes
+        self.dump = dump
+        self.max_bits = max_bits
+
+    # Optimize a tree
+    def optimize(self, node):
+        for pass_class in self.passes:
+            opt_pass = pass_class(self.max_bits)
+            if opt_pass.level > self.level:
+                continue
+
+            if self.dump:
+                print(f"--- before {opt_pass.name} ---\n{dump_tree(node)}", file=self.dump)
+            node = self.run_pass(opt_pass, node)
+            if self.dump:
+                print(f"--- after {opt_pass.name} ---\n{dump_tree(node)}", file=self.dump)
+
+        return node
+
+    # Run one pass over the tree, from the bottom up
+    # Walks the tree with its own stack so deep trees do not hit the recursion limit
+    # A node is only copied when one of its children changed, so the tree that was given is not changed
+    def run_pass(self, opt_pass, node):
+        methods = opt_pass.visit_methods
+        values = []
+        stack = [(node, False, False)]
+        push = stack.append
+        pop = values.pop
+
+        while stack:
+            node, divisor, children_done = stack.pop()
+            node_type = type(node)
+
+            # Optimize the children first
+            if not children_done:
+                if node_type is BinOpNode:
+                    push((node, divisor, True))
+                    push((node.right_node, node.op_tok.type in (TT_DIV, TT_MOD), False))
+                    push((node.left_node, False, False))
+                    continue
+                if node_type is UnaryOpNode:
+                    push((node, divisor, True))
+                    push((node.node, False, False))
+                    continue
+                if node_type is VarAssignNode:
+                    push((node, divisor, True))
+                    push((node.value_node, divisor, False))
+                    continue
+                if node_type not in methods:
+                    raise Exception(f"No optimize method defined for {node_type.__name__}")
+
+            # Put the optimized children in a copy of the node
+            elif node_type is BinOpNode:
+                right = pop()
+                left = pop()
+                if left is not node.left_node or right is not node.right_node:
+                    node = copy.copy(node)
+                    node.left_node = left
+                    node.right_node = right
+            elif node_type is UnaryOpNode:
+                child = pop()
+                if child is not node.node:
+                    node = copy.copy(node)
+                    node.node = child
+            else:
+                child = pop()
+                if child is not node.value_node:
+                    node = copy.copy(node)
+                    node.value_node = child
+
+            method = methods[node_type]
+            values.append(node if method is None else method(opt_pass, node, divisor))
+
+        return values[0]
+
+
+
+# SUBTREE SHARING
+# Turns the tree into a graph where subtrees that are the same are one node, so they are only walked once
+
+# Makes every subtree the same as an earlier one use the earlier node
+# Nodes are only shared when no `def` runs between them, since a `def` could change what they read;
+# the nodes are made in the order they run, so the table of nodes is emptied at every `def`
+# Parents keep their own positions, and the right operands of `/` and `%` are not replaced,
+# so errors still point at the place in the code where they happened
+class SubtreeSharing:
+    # Share the subtrees of a tree
+    # Returns the new tree and the set of operator nodes that are used more than once
+    # Walks the tree with its own stack so deep trees do not hit the recursion limit
+    def share(self, node):
+        table = {}
+        shared = set()
+        values = []
+        stack = [(node, False, False)]
+
+        while stack:
+            node, divisor, children_done = stack.pop()
+            node_type = type(node)
+            if node_type not in NODE_CHILDREN:
+                raise Exception(f"No share method defined for {node_type.__name__}")
+            fields = NODE_CHILDREN[node_type]
+
+            # Share the children first
+            if fields and not children_done:
+                stack.append((node, divisor, True))
+                if node_type is BinOpNode:
+                    stack.append((node.right_node, node.op_tok.type in (TT_DIV, TT_MOD), False))
+                    stack.append((node.left_node, False, False))
+                elif node_type is VarAssignNode:
+                    stack.append((node.value_node, divisor, False))
+                else:
+                    stack.append((node.node, False, False))
+                continue
+
+            # The tree is only used by this compile, so the shared children are put in the node itself
+            if fields:
+                children = values[-len(fields):]
+                del values[-len(fields):]
+                for field, child in zip(fields, children):
+                    setattr(node, field, child)
+
+            # Variable assign node
+            if node_type is VarAssignNode:
+                table.clear()
+                values.append(node)
+                continue
+
+            key = self.key(node)
+            found = table.get(key)
+            if found is None:
+                table[key] = node
+            elif not divisor:
+                if node_type is BinOpNode or node_type is UnaryOpNode:
+                    shared.add(found)
+                node = found
+            values.append(node)
+
+        return values[0], shared
+
+    # Get what makes two nodes the same; children are compared by identity, since they are already shared
+    def key(self, node):
+        node_type = type(node)
+        if node_type is NumberNode:
+            value = node.tok.value
+            return (NumberNode, type(value), value, str(value)) if type(value) is float else (NumberNode, type(value), value)
+        if node_type is VarAccessNode:
+            return (VarAccessNode, node.var_name_tok.value)
+        if node_type is BinOpNode:
+            return (BinOpNode, node.op_tok.type, id(node.left_node), id(node.right_node))
+        return (UnaryOpNode, node.op_tok.type, id(node.node))
+
+# Interpreter that walks each shared node only once in a run, and uses its value again after that
+# Errors stop the run, so only values are remembered
+class MemoInterpreter(Interpreter):
+    # Initialize
+    def __init__(self, shared):
+        self.shared = shared
+        self.memo = {}
+
+    # Visit
+    def visit(self, node, context):
+        if node not in self.shared:
+            return super().visit(node, context)
+        value = self.memo.get(node)
+        if value is not None:
+            return RTResult().success(value)
+        res = super().visit(node, context)
+        if not res.error:
+            self.memo[node] = res.value
+        return res
+
+
+
+# RESOLVER
+# Gives every variable node the slot of its variable, so it is not looked up by name when it runs
+
+# `slots` has the slots the tree uses
+# With `pin`, the slots are never freed; `compile_program` does not pin them, since its `Program` keeps them
+class Resolver:
+    # Initialize
+    def __init__(self, pin=True):
+        self.pin = pin
+        self.slots = set()
+
+    # Resolve a tree
+    # Walks the tree with its own stack so deep trees do not hit the recursion limit
+    def resolve(self, node):
+        slots = self.slots
+        root = node
+        stack = [root]
+
+        while stack:
+            current = stack.pop()
+            node_type = type(current)
+            if node_type not in NODE_CHILDREN:
+                raise Exception(f"No resolve method defined for {node_type.__name__}")
+
+            if node_type is VarAccessNode or node_type is VarAssignNode:
+                current.slot = name_slot(current.var_name_tok.value)
+                slots.add(current.slot)
+            for field in NODE_CHILDREN[node_type]:
+                stack.append(getattr(current, field))
+
+        if self.pin:
+            pin_slots(slots)
+        return root
+
+
+
+# COMPILER
+# Turns the tree into flat bytecode for the virtual machine
+
+# All opcodes
+OP_CONST    = 0
+OP_LOAD     = 1
+OP_STORE    = 2
+OP_ADD      = 3
+OP_SUB      = 4
+OP_MULT     = 5
+OP_DIV      = 6
+OP_MOD      = 7
+OP_POW      = 8
+OP_NEG      = 9
+
+# Opcode names, used for showing the bytecode
+OPCODE_NAMES = [
+    "CONST", "LOAD", "STORE", "ADD", "SUB",
+    "MULT", "DIV", "MOD", "POW", "NEG",
+]
+
+# Binary operator token types and their opcodes
+BINARY_OPCODES = {
+    TT_PLUS: OP_ADD,
+    TT_MINUS: OP_SUB,
+    TT_MULT: OP_MULT,
+    TT_DIV: OP_DIV,
+    TT_MOD: OP_MOD,
+    TT_POW: OP_POW,
+}
+
+# Compiled program
+# Every instruction takes three slots: opcode, argument and span index
+# `LOAD` and `STORE` take the index of a name, `slots` has the symbol table slot of each name
+# `node` is the node of the whole program, for errors of instructions that have no node
+class Code:
+    # Initialize
+    def __init__(self):
+        self.instructions = array("l")
+        self.consts = []
+        self.names = []
+        self.slots = []
+        self.spans = []
+        self.node = None
+        self.const_idx = {}
+        self.name_idx = {}
+        slot_users.add(self)
+
+    # Add an instruction
+    def emit(self, op, arg=0, span=-1):
+        self.instructions.extend((op, arg, span))
+
+    # Add a constant to the constant pool
+    # 0.0 and -0.0 are equal, so the sign is part of the key
+    def add_const(self, value):
+        key = (type(value), value, str(value)) if type(value) is float else (type(value), value)
+        if key not in self.const_idx:
+            self.const_idx[key] = len(self.consts)
+            self.consts.append(value)
+        return self.const_idx[key]
+
+    # Add a variable name to the name pool
+    # `slot` is the slot the node of the name was given, names of trees that were not resolved get theirs here
+    def add_name(self, name, slot=None):
+        if name not in self.name_idx:
+            self.name_idx[name] = len(self.names)
+            self.names.append(name)
+            self.slots.append(name_slot(name) if slot is None else slot)
+        return self.name_idx[name]
+
+    # Get the slots the code uses
+    def used_slots(self):
+        return self.slots
+
+    # Add the node that has the position of the value of a node
+    def add_span(self, node):
+        self.spans.append(span_node(node))
+        return len(self.spans) - 1
+
+    # Represent
+    def __repr__(self):
+        ins = self.instructions
+        return "\n".join(
+            f"{pc // 3:4} {OPCODE_NAMES[ins[pc]]} {ins[pc + 1]}"
+            for pc in range(0, len(ins), 3)
+        )
+
+class Compiler:
+    # Compile a tree
+    # Walks the tree with its own stack so deep trees do not hit the recursion limit
+    def compile(self, node):
+        code = Code()
+        code.node = span_node(node)
+        stack = [(node, False)]
+
+        while stack:
+            node, children_done = stack.pop()
+            node_type = type(node)
+
+            # Number node
+            if node_type is NumberNode:
+                code.emit(OP_CONST, code.add_const(node.tok.value))
+
+            # Variable access node
+            elif node_type is VarAccessNode:
+                code.emit(OP_LOAD, code.add_name(node.var_name_tok.value, node.slot), code.add_span(node))
+
+            # Variable assign node
+            elif node_type is VarAssignNode:
+                if children_done:
+                    code.emit(OP_STORE, code.add_name(node.var_name_tok.value, node.slot))
+                else:
+                    stack.append((node, True))
+                    stack.append((node.value_node, False))
+
+            # Binary operator node
+            # Division errors point at the right operand
+            elif node_type is BinOpNode:
+                if children_done:
+                    code.emit(BINARY_OPCODES[node.op_tok.type], 0, code.add_span(node.right_node))
+                else:
+                    stack.append((node, True))
+                    stack.append((node.right_node, False))
+                    stack.append((node.left_node, False))
+
+            # Unary operator node
+            elif node_type is UnaryOpNode:
+                if children_done:
+                    if node.op_tok.type == TT_MINUS:
+                        code.emit(OP_NEG)
+                else:
+                    stack.append((node, True))
+                    stack.append((node.node, False))
+
+            else:
+                self.no_compile_method(node)
+
+        return code
+
+    # Throws error if a node type cannot be compiled
+    def no_compile_method(self, node):
+        raise Exception(f"No compile method defined for {type(node).__name__}")
+
+
+
+# VIRTUAL MACHINE
+# Runs the bytecode made by the compiler
+
+class VM:
+    # Execute compiled code
+    # With a `budget`, the deadline is checked between chunks of instructions and sizes before `^`, `*` and `%`
+    def execute(self, code, context, budget=None, deadline=None):
+        res = RTResult()
+        ins = code.instructions
+        consts = code.consts
+        slots = code.slots
+        symbol_table = context.symbol_table
+        max_bits = None if budget is None else budget.max_bits
+        stack = []
+        push = stack.append
+        pop = stack.pop
+
+        # Without a deadline, all the instructions are one chunk
+        chunk = len(ins) if deadline is None else DEADLINE_CHECK_STEPS * 3
+        for chunk_start in range(0, len(ins), chunk or 1):
+            if deadline is not None and chunk_start and time.monotonic() > deadline:
+                node = code.spans[ins[chunk_start + 2]] if ins[chunk_start + 2] >= 0 else code.node
+                return res.failure(time_error(node, budget, context))
+
+            for pc in range(chunk_start, min(chunk_start + chunk, len(ins)), 3):
+                op = ins[pc]
+
+                if op == OP_CONST:
+                    push(consts[ins[pc + 1]])
+                elif op == OP_LOAD:
+                    value = symbol_table.get_slot(slots[ins[pc + 1]])
+
+                    # Checks if it is defined yet
+                    if value is None:
+                        name = code.names[ins[pc + 1]]
+                        return res.failure(self.error(code, pc, f"'{name}' is not defined", context))
+                    push(value)
+                elif op == OP_STORE:
+                    symbol_table.set_slot(slots[ins[pc + 1]], stack[-1])
+                elif op == OP_ADD:
+                    right = pop()
+                    stack[-1] += right
+                elif op == OP_SUB:
+                    right = pop()
+                    stack[-1] -= right
+                elif op == OP_MULT:
+                    right = pop()
+                    if max_bits is not None and estimate_bits(TT_MULT, stack[-1], right) > max_bits:
+                        return res.failure(self.size_error(code, pc, TT_MULT, stack[-1], right, budget, context))
+                    stack[-1] *= right
+                elif op == OP_DIV:
+                    right = pop()
+                    if right == 0:
+                        return res.failure(self.error(code, pc, "Cannot divide by zero", context))
+                    stack[-1] /= right
+                elif op == OP_MOD:
+                    right = pop()
+                    if max_bits is not None and estimate_bits(TT_MOD, stack[-1], right) > max_bits:
+                        return res.failure(self.size_error(code, pc, TT_MOD, stack[-1], right, budget, context))
+                    if right == 0:
+                        return res.failure(self.error(code, pc, "Cannot divide by zero", context))
+                    stack[-1] %= right
+                elif op == OP_POW:
+                    right = pop()
+                    if max_bits is not None and estimate_bits(TT_POW, stack[-1], right) > max_bits:
+                        return res.failure(self.size_error(code, pc, TT_POW, stack[-1], right, budget, context))
+                    stack[-1] **= right
+                elif op == OP_NEG:
+                    stack[-1] = -stack[-1]
+
+        return res.success(stack[-1])
+
+    # Make the error for a result that would be too big
+    def size_error(self, code, pc, op, left, right, budget, context):
+        return size_error(estimate_bits(op, left, right), budget, code.spans[code.instructions[pc + 2]], context)
+
+    # Make a runtime error at the position of an instruction
+    def error(self, code, pc, details, context):
+        node = code.spans[code.instructions[pc + 2]]
+        return RTError(node.pos_start, node.pos_end, details, context)
+
+
+
+# TIERED EXECUTION
+# Code that runs often is turned into Python code
+
+# Python operators for each binary operator token type
+PY_OPERATORS = {
+    TT_PLUS: "+",
+    TT_MINUS: "-",
+    TT_MULT: "*",
+    TT_DIV: "/",
+    TT_MOD: "%",
+    TT_POW: "**",
+}
+
+# Generates Python source code from a tree
+# Every node gets its own line, so errors can be traced back to the node
+class PyCodeGenerator:
+    # Generate the source code
+    # Returns the source, the constants it uses and a table of line numbers to the node and message of their error
+    # Nodes in `shared` are only turned into code once, later uses read the same variable (see `SubtreeSharing`)
+    def generate(self, node, shared=()):
+        lines = ["def program(get, store):"]
+        consts = []
+        line_table = {}
+        temps = {}
+        temp_count = 0
+        stack = [(node, False)]
+
+        while stack:
+            node, children_done = stack.pop()
+            if not children_done and node in shared and id(node) in temps:
+                continue
+            node_type = type(node)
+            temp = f"v{temp_count}"
+            temp_count += 1
+
+            # Number node
+            if node_type is NumberNode:
+                lines.append(f"    {temp} = K[{len(consts)}]")
+                consts.append(node.tok.value)
+
+            # Variable access node
+            elif node_type is VarAccessNode:
+                var_name = node.var_name_tok.value
+                lines.append(f"    {temp} = get({node.slot})")
+                lines.append(f"    if {temp} is None: raise NameError")
+                line_table[len(lines)] = (node, f"'{var_name}' is not defined")
+
+            # Variable assign node
+            elif node_type is VarAssignNode:
+                if not children_done:
+                    stack.append((node, True))
+                    stack.append((node.value_node, False))
+                    continue
+                temp = temps[id(node.value_node)]
+                lines.append(f"    store({node.slot}, {temp})")
+
+            # Binary operator node
+            elif node_type is BinOpNode:
+                if not children_done:
+                    stack.append((node, True))
+                    stack.append((node.right_node, False))
+                    stack.append((node.left_node, False))
+                    continue
+                left = temps[id(node.left_node)]
+                right = temps[id(node.right_node)]
+                lines.append(f"    {temp} = {left} {PY_OPERATORS[node.op_tok.type]} {right}")
+
+                # Division errors point at the right operand
+                if node.op_tok.type in (TT_DIV, TT_MOD):
+                    line_table[len(lines)] = (span_node(node.right_node), "Cannot divide by zero")
+
+            # Unary operator node
+            elif node_type is UnaryOpNode:
+                if not children_done:
+                    stack.append((node, True))
+                    stack.append((node.node, False))
+                    continue
+                if node.op_tok.type == TT_MINUS:
+                    lines.append(f"    {temp} = -{temps[id(node.node)]}")
+                else:
+                    temp = temps[id(node.node)]
+
+            else:
+                self.no_generate_method(node)
+
+            temps[id(node)] = temp
+
+        lines.append(f"    return {temps[id(node)]}")
+        return "\n".join(lines) + "\n", consts, line_table
+
+    # Throws error if a node type cannot be turned into Python code
+    def no_generate_method(self, node):
+        raise Exception(f"No generate method defined for {type(node).__name__}")
+
+# A program turned into a Python code object
+# The slots of the variables are in the code, so it keeps them from being freed
+class PyProgram:
+    # Initialize
+    def __init__(self, fn, node, shared=()):
+        source, consts, self.line_table = PyCodeGenerator().generate(node, shared)
+        self.slots = tree_slots(node)
+        slot_users.add(self)
+        self.filename = f"<quartz {fn}>"
+        namespace = {"K": tuple(consts)}
+        exec(compile(source, self.filename, "exec"), namespace)
+        self.function = namespace["program"]
+
+    # Get the slots the code uses
+    def used_slots(self):
+        return self.slots
+
+    # Execute the program
+    def execute(self, context):
+        res = RTResult()
+        symbol_table = context.symbol_table
+
+        try:
+            value = self.function(symbol_table.get_slot, symbol_table.set_slot)
+        except (ZeroDivisionError, NameError) as error:
+            # Find the line of the generated code that failed
+            tb = error.__traceback__
+            line = None
+            while tb:
+                if tb.tb_frame.f_code.co_filename == self.filename:
+                    line = tb.tb_lineno
+                tb = tb.tb_next
+
+            # Errors that do not come from a known line are not Quartz errors
+            if line not in self.line_table:
+                raise
+            node, details = self.line_table[line]
+            return res.failure(RTError(node.pos_start, node.pos_end, details, context))
+
+        return res.success(value)
+
+# Number of runs before a program is turned into Python code
+TIER_THRESHOLD = 50
+
+
+
+# COMPILE CACHE
+# Keeps the trees of code that was run before, so the same code is not lexed and parsed again
+
+# Estimated bytes of memory taken by each node and its token (see `bench_memory.py`)
+NODE_BYTES = 200
+
+# Code that was lexed, parsed and optimized
+# Only the error or the tree comes from the code, the other parts are filled in when the program runs
+# The slots of the variables of the tree are not freed while the program is alive (see `free_slots`)
+class Program:
+    __slots__ = ("node", "error", "size", "runs", "code", "py_program", "tokens", "nodes", "shared", "slots",
+                 "depth", "__weakref__")
+
+    # Initialize
+    # `tokens` is only counted when the program is compiled with `RunStats`
+    # `shared` has the nodes used more than once, when the program was compiled with `share`
+    # `slots` has the slots of the tree, they are found from the tree when they are not given
+    def __init__(self, node, error, size, tokens=None, nodes=None, shared=None, slots=None):
+        self.node = node
+        self.error = error
+        self.size = size
+        self.tokens = tokens
+        self.nodes = nodes
+        self.shared = shared
+        self.runs = 0
+        self.code = None
+        self.py_program = None
+        self.depth = None
+        self.slots = ()
+        if node is not None:
+            self.slots = tree_slots(node) if slots is None else slots
+            slot_users.add(self)
+
+    # Get the slots the tree uses
+    def used_slots(self):
+        return self.slots
+
+# Least recently used cache of programs, limited by number of entries and by estimated bytes
+class CompileCache:
+    # Initialize
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.enabled = True
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    # Get a program, or None if it is not in the cache
+    def get(self, key):
+        with self.lock:
+            program = self.entries.get(key)
+            if program is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return program
+
+    # Add a program
+    def put(self, key, program):
+        with self.lock:
+            # Programs bigger than the whole cache are not kept
+            if program.size > self.max_bytes or key in self.entries:
+                return
+            self.entries[key] = program
+            self.bytes += program.size
+
+            # Remove the least recently used programs until it fits
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                old_key, old_program = self.entries.popitem(last=False)
+                self.bytes -= old_program.size
+                self.evictions += 1
+
+    # Remove every program
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    # Returns the counters of the cache
+    def stats(self):
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+compile_cache = CompileCache()
+
+
+
+# DISK CACHE
+# Keeps the trees of code in files, so a new process does not lex and parse code that an earlier one did
+# Trees are saved as flat lists of plain values with `marshal`, like Python's `.pyc` files
+
+# Version of the format of the files; files of other versions are not used
+DISK_CACHE_FORMAT = 1
+
+# Kind of each node in a saved tree
+NODE_KINDS = {NumberNode: 0, VarAccessNode: 1, VarAssignNode: 2, BinOpNode: 3, UnaryOpNode: 4}
+
+# Turn a tree into a list of tuples, children come before their parents and are kept as indexes
+# A node used more than once, like a shared subtree, is saved once
+# Walks the tree with its own stack so deep trees do not hit the recursion limit
+def flatten_tree(node):
+    records = []
+    indexes = {}
+    stack = [(node, False)]
+
+    while stack:
+        node, children_done = stack.pop()
+        if id(node) in indexes:
+            continue
+        node_type = type(node)
+        fields = NODE_CHILDREN[node_type]
+        if fields and not children_done:
+            stack.append((node, True))
+            for field in reversed(fields):
+                stack.append((getattr(node, field), False))
+            continue
+
+        kind = NODE_KINDS[node_type]
+        if node_type is NumberNode:
+            tok = node.tok
+            record = (kind, node.start, node.end, tok.type, tok.value, tok.start, tok.end)
+        elif node_type is VarAccessNode:
+            tok = node.var_name_tok
+            record = (kind, node.start, node.end, tok.value, tok.start, tok.end)
+        elif node_type is VarAssignNode:
+            tok = node.var_name_tok
+            record = (kind, node.start, node.end, tok.value, tok.start, tok.end, indexes[id(node.value_node)])
+        elif node_type is BinOpNode:
+            tok = node.op_tok
+            record = (kind, node.start, node.end, tok.type, tok.start, tok.end,
+                      indexes[id(node.left_node)], indexes[id(node.right_node)])
+        else:
+            tok = node.op_tok
+            record = (kind, node.start, node.end, tok.type, tok.start, tok.end, indexes[id(node.node)])
+
+        indexes[id(node)] = len(records)
+        records.append(record)
+
+    return records, indexes
+
+# Make the nodes of a list made by `flatten_tree` again, with positions in `source`
+# Slots are only the same inside one process, so variables get the slots of this process, like `Resolver` gives them
+# Returns the list of nodes, the root is the last one
+def unflatten_tree(records, source):
+    nodes = []
+    for record in records:
+        kind, start, end = record[0], record[1], record[2]
+        if kind == 0:
+            node = NumberNode(Token(record[3], record[4], record[5], record[6], source))
+        elif kind == 1:
+            node = VarAccessNode(Token(TT_IDENT, record[3], record[4], record[5], source))
+            node.slot = name_slot(record[3])
+        elif kind == 2:
+            node = VarAssignNode(Token(TT_IDENT, record[3], record[4], record[5], source), nodes[record[6]])
+            node.slot = name_slot(record[3])
+        elif kind == 3:
+            node = BinOpNode(nodes[record[6]], Token(record[3], None, record[4], record[5], source), nodes[record[7]])
+        elif kind == 4:
+            node = UnaryOpNode(Token(record[3], None, record[4], record[5], source), nodes[record[6]])
+        else:
+            raise ValueError(f"Unknown node kind {kind}")
+        node.start = start
+        node.end = end
+        nodes.append(node)
+    return nodes
+
+# Write a file so other processes only ever see the old file or the whole new one
+# The data is written to a temporary file in the same folder, which then takes the place of the file
+def write_atomic(path, data):
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+# Folder of saved programs, one file per program
+# The name of each file is a hash of the code, its options, the version of Quartz and the version of Python,
+# so changed code or a new version never reads an old file
+# Programs with errors are not saved; they are fast to make again
+# Files are only read by `marshal`, which cannot run code, but a folder other users can write to should not be used
+class DiskCache:
+    # Initialize
+    def __init__(self, path):
+        self.path = path
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        os.makedirs(path, exist_ok=True)
+
+    # Get the file of some code
+    def file_path(self, fn, text, opt_level, share, max_bits):
+        key = marshal.dumps((DISK_CACHE_FORMAT, VERSION, sys.implementation.cache_tag, fn, opt_level, share, max_bits,
+                             text))
+        return os.path.join(self.path, hashlib.sha256(key).hexdigest() + ".qzc")
+
+    # Get the program of some code, or None if it was not saved
+    # Files that cannot be read count as errors, and are written again when the program is saved
+    def get(self, fn, text, opt_level, share, max_bits):
+        try:
+            with open(self.file_path(fn, text, opt_level, share, max_bits), "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except OSError:
+            self.errors += 1
+            return None
+
+        try:
+            file_format, records, shared_indexes, node_count = marshal.loads(data)
+            if file_format != DISK_CACHE_FORMAT:
+                raise ValueError(f"Unknown format {file_format}")
+            nodes = unflatten_tree(records, Source(fn, text))
+        except (EOFError, ValueError, TypeError, IndexError):
+            self.errors += 1
+            return None
+
+        node = nodes[-1]
+        shared = {nodes[index] for index in shared_indexes} if share else None
+        self.hits += 1
+        return Program(node, None, sys.getsizeof(text) + node_count * NODE_BYTES, None, node_count, shared)
+
+    # Save the program of some code
+    # Files that cannot be written are skipped, the cache only makes runs faster
+    def put(self, fn, text, opt_level, share, max_bits, program):
+        if program.error:
+            return
+        records, indexes = flatten_tree(program.node)
+        shared_indexes = [indexes[id(node)] for node in program.shared] if program.shared else []
+        try:
+            write_atomic(self.file_path(fn, text, opt_level, share, max_bits),
+                         marshal.dumps((DISK_CACHE_FORMAT, records, shared_indexes, program.nodes)))
+        except OSError:
+            self.errors += 1
+            return
+        self.writes += 1
+
+    # Remove every saved program
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith(".qzc"):
+                try:
+                    os.unlink(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    pass
+
+    # Returns the counters of the cache
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "errors": self.errors,
+        }
+
+# Disk cache used by sessions when a program is not in `compile_cache`, None to not use one
+# Set it with `quartz.disk_cache = quartz.DiskCache(path)`
+disk_cache = None
+
+# Version of the format of snapshot files
+SNAPSHOT_FORMAT = 1
+
+
+
+# FLAT TREES
+# Keeps a tree in arrays with one entry per node, instead of a node object and a token object per node,
+# so very big generated code takes much less memory and is read from memory that is close together
+# Children always come before their parents, in the order a walk of the tree runs them,
+# so running the nodes in the order of their indexes is the same as walking the tree
+
+# Node kinds, the same as in `NODE_KINDS`
+FLAT_NUMBER = NODE_KINDS[NumberNode]
+FLAT_ACCESS = NODE_KINDS[VarAccessNode]
+FLAT_ASSIGN = NODE_KINDS[VarAssignNode]
+FLAT_BINARY = NODE_KINDS[BinOpNode]
+FLAT_UNARY = NODE_KINDS[UnaryOpNode]
+
+# Token type of each code in the `ops` array
+FLAT_TOKEN_TYPES = [TT_PLUS, TT_MINUS, TT_MULT, TT_DIV, TT_MOD, TT_POW, TT_INT, TT_FLOAT, TT_IDENT]
+FLAT_TOKEN_CODES = {tok_type: code for code, tok_type in enumerate(FLAT_TOKEN_TYPES)}
+FLAT_MINUS = FLAT_TOKEN_CODES[TT_MINUS]
+FLAT_DIV = FLAT_TOKEN_CODES[TT_DIV]
+FLAT_MOD = FLAT_TOKEN_CODES[TT_MOD]
+
+# Python function for each binary operator code
+FLAT_FUNCTIONS = [BINARY_FUNCTIONS.get(tok_type) for tok_type in FLAT_TOKEN_TYPES]
+
+# A tree kept in parallel arrays, indexed by node
+# `kinds` has the kind of each node, `ops` the code of the type of its token (see `FLAT_TOKEN_TYPES`),
+# `lefts` and `rights` the indexes of its children (-1 for none; unary operators and assignments only have a left one),
+# `values` the index of its number in `consts` or of its name in `names`, and `starts`, `ends` and `tok_starts`
+# the offsets of the node and of its token in the code
+# The last node is the root
+class FlatTree:
+    __slots__ = ("kinds", "ops", "lefts", "rights", "values", "starts", "ends", "tok_starts", "consts", "names", "source")
+
+    # Initialize
+    def __init__(self, source=None):
+        self.kinds = array("B")
+        self.ops = array("B")
+        self.lefts = array("i")
+        self.rights = array("i")
+        self.values = array("i")
+        self.starts = array("i")
+        self.ends = array("i")
+        self.tok_starts = array("i")
+        self.consts = []
+        self.names = []
+        self.source = source
+
+    # Number of nodes
+    def __len__(self):
+        return len(self.kinds)
+
+    # Bytes taken by the arrays
+    def nbytes(self):
+        arrays = (self.kinds, self.ops, self.lefts, self.rights, self.values, self.starts, self.ends, self.tok_starts)
+        return sum(len(values) * values.itemsize for values in arrays)
+
+    # Get the index of the node whose position the value of a node has (see `span_node`)
+    def span_index(self, index):
+        while self.kinds[index] == FLAT_ASSIGN:
+            index = self.lefts[index]
+        return index
+
+    # Start position of a node
+    def pos_start(self, index):
+        return Position(self.starts[index], self.source)
+
+    # End position of a node
+    def pos_end(self, index):
+        return Position(self.ends[index], self.source)
+
+# Writes the nodes the parser makes into a `FlatTree`, see `NodeBuilder`
+# The parser gets node indexes instead of nodes
+class FlatTreeBuilder:
+    # Initialize
+    def __init__(self):
+        self.tree = FlatTree()
+        self.const_idx = {}
+        self.name_idx = {}
+
+    # Number node
+    def number(self, tok):
+        return self.add(FLAT_NUMBER, tok, -1, -1, self.add_const(tok.value), tok.start, tok.end)
+
+    # Variable access node
+    def var_access(self, var_name_tok):
+        return self.add(FLAT_ACCESS, var_name_tok, -1, -1, self.add_name(var_name_tok.value),
+                        var_name_tok.start, var_name_tok.end)
+
+    # Variable assign node
+    def var_assign(self, var_name_tok, value_node):
+        return self.add(FLAT_ASSIGN, var_name_tok, value_node, -1, self.add_name(var_name_tok.value),
+                        var_name_tok.start, self.tree.ends[value_node])
+
+    # Binary operator node
+    def bin_op(self, left_node, op_tok, right_node):
+        tree = self.tree
+        return self.add(FLAT_BINARY, op_tok, left_node, right_node, -1, tree.starts[left_node], tree.ends[right_node])
+
+    # Unary operator node
+    def unary_op(self, op_tok, node):
+        return self.add(FLAT_UNARY, op_tok, node, -1, -1, op_tok.start, self.tree.ends[node])
+
+    # Add a node to the arrays
+    # Returns the index of the node
+    def add(self, kind, tok, left, right, value, start, end):
+        tree = self.tree
+        if tree.source is None:
+            tree.source = tok.source
+        tree.kinds.append(kind)
+        tree.ops.append(FLAT_TOKEN_CODES[tok.type])
+        tree.lefts.append(left)
+        tree.rights.append(right)
+        tree.values.append(value)
+        tree.starts.append(start)
+        tree.ends.append(end)
+        tree.tok_starts.append(tok.start)
+        return len(tree.kinds) - 1
+
+    # Add a number to the constant pool
+    def add_const(self, value):
+        key = (type(value), value, str(value)) if type(value) is float else (type(value), value)
+        index = self.const_idx.get(key)
+        if index is None:
+            index = self.const_idx[key] = len(self.tree.consts)
+            self.tree.consts.append(value)
+        return index
+
+    # Add a variable name to the name pool
+    def add_name(self, name):
+        index = self.name_idx.get(name)
+        if index is None:
+            index = self.name_idx[name] = len(self.tree.names)
+            self.tree.names.append(name)
+        return index
+
+# Lex and parse code straight into a `FlatTree`, without making node objects
+# Flat trees are not optimized; `to_flat_tree` turns an optimized tree into one
+# Returns the tree and the error
+def parse_flat(fn, text, lexer=None, parser=None):
+    builder = FlatTreeBuilder()
+    tokens = LEXERS[lexer or DEFAULT_LEXER](fn, text).iter_tokens()
+    try:
+        ast = PARSERS[parser or DEFAULT_PARSER](tokens, builder).parse()
+
+        # A CharError anywhere in the code comes before a syntax error
+        if ast.error:
+            for tok in tokens:
+                pass
+            return None, ast.error
+    except LexError as error:
+        return None, error.error
+    return builder.tree, None
+
+# Turn a tree of nodes into a `FlatTree`
+# A node used more than once, like a shared subtree, is added once
+# Walks the tree with its own stack so deep trees do not hit the recursion limit
+def to_flat_tree(node):
+    builder = FlatTreeBuilder()
+    tree = builder.tree
+    indexes = {}
+    stack = [(node, False)]
+
+    while stack:
+        node, children_done = stack.pop()
+        if id(node) in indexes:
+            continue
+        node_type = type(node)
+        fields = NODE_CHILDREN[node_type]
+        if fields and not children_done:
+            stack.append((node, True))
+            for field in reversed(fields):
+                stack.append((getattr(node, field), False))
+            continue
+
+        if node_type is NumberNode:
+            index = builder.number(node.tok)
+        elif node_type is VarAccessNode:
+            index = builder.var_access(node.var_name_tok)
+        elif node_type is VarAssignNode:
+            index = builder.var_assign(node.var_name_tok, indexes[id(node.value_node)])
+        elif node_type is BinOpNode:
+            index = builder.bin_op(indexes[id(node.left_node)], node.op_tok, indexes[id(node.right_node)])
+        else:
+            index = builder.unary_op(node.op_tok, indexes[id(node.node)])
+
+        # The optimizer can give nodes other positions than their tokens
+        tree.starts[index] = node.start
+        tree.ends[index] = node.end
+        indexes[id(node)] = index
+
+    return tree
+
+# Turn a `FlatTree` back into a tree of nodes, with the slots of its variables given
+# Like `Resolver`, the slots are pinned, since the tree is not kept by a `Program`
+# Operator tokens are one character long, so only the start of each token is kept
+def from_flat_tree(tree):
+    source = tree.source
+    slots = [name_slot(name, True) for name in tree.names]
+    nodes = []
+    for index, kind in enumerate(tree.kinds):
+        tok_type = FLAT_TOKEN_TYPES[tree.ops[index]]
+        tok_start = tree.tok_starts[index]
+        left = tree.lefts[index]
+
+        if kind == FLAT_NUMBER:
+            node = NumberNode(Token(tok_type, tree.consts[tree.values[index]], tok_start, tree.ends[index], source))
+        elif kind == FLAT_ACCESS or kind == FLAT_ASSIGN:
+            name = tree.names[tree.values[index]]
+            tok = Token(tok_type, name, tok_start, tok_start + len(name), source)
+            node = VarAccessNode(tok) if kind == FLAT_ACCESS else VarAssignNode(tok, nodes[left])
+            node.slot = slots[tree.values[index]]
+        elif kind == FLAT_BINARY:
+            node = BinOpNode(nodes[left], Token(tok_type, None, tok_start, None, source), nodes[tree.rights[index]])
+        else:
+            node = UnaryOpNode(Token(tok_type, None, tok_start, None, source), nodes[left])
+
+        node.start = tree.starts[index]
+        node.end = tree.ends[index]
+        nodes.append(node)
+
+    return nodes[-1]
+
+# Runs a `FlatTree` one node at a time in the order of the indexes, with the values in a list by index
+class FlatEvaluator:
+    # Evaluate a tree
+    # Returns a runtime result like `Interpreter.visit`
+    def evaluate(self, tree, context):
+        res = RTResult()
+        ops, lefts, rights, values = tree.ops, tree.lefts, tree.rights, tree.values
+        consts = tree.consts
+        slots = [name_slot(name) for name in tree.names]
+        symbol_table = context.symbol_table
+        results = [None] * len(tree)
+
+        for index, kind in enumerate(tree.kinds):
+            # Binary operator node
+            if kind == FLAT_BINARY:
+                right = results[rights[index]]
+                op = ops[index]
+
+                # Checks for division by zero
+                if right == 0 and (op == FLAT_DIV or op == FLAT_MOD):
+                    node = tree.span_index(rights[index])
+                    return res.failure(RTError(tree.pos_start(node), tree.pos_end(node), "Cannot divide by zero", context))
+
+                results[index] = FLAT_FUNCTIONS[op](results[lefts[index]], right)
+
+            # Number node
+            elif kind == FLAT_NUMBER:
+                results[index] = consts[values[index]]
+
+            # Variable access node
+            elif kind == FLAT_ACCESS:
+                value = symbol_table.get_slot(slots[values[index]])
+
+                # Checks if it is defined yet
+                if value is None:
+                    return res.failure(RTError(
+                        tree.pos_start(index), tree.pos_end(index),
+                        f"'{tree.names[values[index]]}' is not defined",
+                        context
+                    ))
+                results[index] = value
+
+            # Unary operator node
+            elif kind == FLAT_UNARY:
+                value = results[lefts[index]]
+                results[index] = -value if ops[index] == FLAT_MINUS else value
+
+            # Variable assign node
+            else:
+                value = results[lefts[index]]
+                symbol_table.set_slot(slots[values[index]], value)
+                results[index] = value
+
+        return res.success(results[-1])
+
+
+
+# INSTRUMENTATION
+# Measures where the time of a run goes and counts what it did
+# Only used when a `RunStats` is given to `run`, so runs without it do not pay for it
+
+# Times and counts of one run
+# Phases are in nanoseconds; phases that did not happen, like lexing code from the cache, are not there
+class RunStats:
+    __slots__ = ("backend", "cache_hit", "phases", "tokens", "nodes", "visits", "hits", "misses", "stores")
+
+    # Initialize
+    def __init__(self):
+        self.backend = None
+        self.cache_hit = False
+        self.phases = {}
+        self.tokens = None
+        self.nodes = None
+        self.visits = {}
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    # Get the stats as a dictionary
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    # Represent
+    def __repr__(self):
+        lines = [f"backend: {self.backend}{' (cached)' if self.cache_hit else ''}"]
+        for phase, ns in self.phases.items():
+            lines.append(f"{phase}: {ns / 1000:.1f} us")
+        lines.append(f"tokens: {'-' if self.tokens is None else self.tokens}, nodes: {'-' if self.nodes is None else self.nodes}")
+        if self.visits:
+            lines.append("visits: " + ", ".join(f"{name} {count}" for name, count in self.visits.items()))
+        lines.append(f"symbols: {self.hits} hits, {self.misses} misses, {self.stores} stores")
+        return "\n".join(lines)
+
+# Symbol table that counts the variables read and set through it
+# Only the current run goes through it, the variables stay in the real table
+class CountingSymbolTable:
+    # Initialize
+    def __init__(self, symbol_table, stats):
+        self.symbol_table = symbol_table
+        self.stats = stats
+
+    # Get a variable by name
+    def get(self, name):
+        slot = NAME_SLOTS.get(name)
+        if slot is None:
+            self.stats.misses += 1
+            return None
+        return self.get_slot(slot)
+
+    # Get a variable by slot
+    def get_slot(self, slot):
+        value = self.symbol_table.get_slot(slot)
+        if value is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return value
+
+    # Set a variable by name
+    def set(self, name, value):
+        self.set_slot(name_slot(name), value)
+
+    # Set a variable by slot
+    def set_slot(self, slot, value):
+        self.stats.stores += 1
+        self.symbol_table.set_slot(slot, value)
+
+# Interpreter that counts the nodes it visits by node type
+class CountingInterpreter(Interpreter):
+    # Initialize
+    def __init__(self, stats):
+        self.stats = stats
+
+    # Visit
+    def visit(self, node, context):
+        visits = self.stats.visits
+        name = type(node).__name__
+        visits[name] = visits.get(name, 0) + 1
+        return super().visit(node, context)
+
+# Interpreter that counts its visits and keeps to a budget
+class CountingLimitedInterpreter(CountingInterpreter, LimitedInterpreter):
+    # Initialize
+    def __init__(self, stats, budget, deadline):
+        CountingInterpreter.__init__(self, stats)
+        LimitedInterpreter.__init__(self, budget, deadline)
 
-    return result.value, result.error
 
 
+# RUN
+# Run the user's code
+
+# Built-in variables, shared by every session
+builtin_symbol_table = FrozenSymbolTable({
+    "null": 0,
+})
+
+# Backend used to run the code: "interpreter" walks the tree, "vm" compiles it to bytecode first,
+# "tiered" walks the tree until the code gets hot and then runs it as Python code
+BACKENDS = ("interpreter", "vm", "tiered")
+DEFAULT_BACKEND = "tiered"
+
+# Optimizer level used on the tree before it runs (see `Optimizer`)
+DEFAULT_OPT_LEVEL = 1
+
+# Lexer used to make the tokens: "scan" reads one character at a time, "regex" finds whole tokens
+LEXERS = {
+    "scan": Lexer,
+    "regex": RegexLexer,
+}
+DEFAULT_LEXER = "regex"
+
+# Parser used to make the tree: "recursive" has a method for each grammar rule,
+# "climbing" uses its own stacks and can read deeply nested code
+PARSERS = {
+    "recursive": Parser,
+    "climbing": ClimbingParser,
+}
+DEFAULT_PARSER = "climbing"
+
+# Whether subtrees that are the same are shared and only run once per run (see `SubtreeSharing`)
+DEFAULT_SHARE = False
+
+# The interpreters call themselves for every level of the tree, with up to this many Python frames per level
+FRAMES_PER_LEVEL = 4
+
+# Python frames left for the code that calls `run`
+RESERVED_FRAMES = 200
+
+# Get the number of levels of the deepest tree the interpreters can walk without going over Python's recursion limit
+# Deeper trees are run by the VM, which does not call itself
+def max_walk_depth():
+    return (sys.getrecursionlimit() - RESERVED_FRAMES) // FRAMES_PER_LEVEL
+
+# Lex, parse and optimize code
+# With `stats`, the time of each phase is put in it
+# `start`, `first_line` and `first_col` are given to the lexer, for code that is a part of a file
+# With `share`, subtrees that are the same become one node after the tree is optimized
+# `max_bits` is the size limit the optimizer keeps to (see `fold_limit`)
+def compile_program(fn, text, lexer=None, opt_level=None, parser=None, stats=None, start=0, first_line=0, first_col=0,
+                    share=False, max_bits=None):
+    opt_level = DEFAULT_OPT_LEVEL if opt_level is None else opt_level
+    size = sys.getsizeof(text)
+    token_count = None
+
+    # Free the slots of names that are not used anymore, here where no other tree is half made (see `free_slots`)
+    if new_slots > new_slots_limit and threading.active_count() == 1:
+        free_slots()
+
+    # Generate tokens and AST
+    # The parser reads the tokens while the lexer makes them
+    if stats is None:
+        tokens = LEXERS[lexer or DEFAULT_LEXER](fn, text, start, first_line, first_col).iter_tokens()
+        try:
+            ast = PARSERS[parser or DEFAULT_PARSER](tokens).parse()
+
+            # A CharError anywhere in the code comes before a syntax error
+            if ast.error:
+                for tok in tokens:
+                    pass
+                return Program(None, ast.error, size)
+        except LexError as error:
+            return Program(None, error.error, size)
+
+    # To time them apart, the lexer makes all the tokens before the parser starts
+    else:
+        t0 = time.perf_counter_ns()
+        tokens, error = LEXERS[lexer or DEFAULT_LEXER](fn, text, start, first_line, first_col).make_tokens()
+        stats.phases["lex"] = time.perf_counter_ns() - t0
+        if error:
+            return Program(None, error, size)
+        token_count = stats.tokens = len(tokens)
+
+        t0 = time.perf_counter_ns()
+        ast = PARSERS[parser or DEFAULT_PARSER](tokens).parse()
+        stats.phases["parse"] = time.perf_counter_ns() - t0
+        if ast.error:
+            return Program(None, ast.error, size, token_count)
+    node = ast.node
+
+    # Optimize AST
+    if opt_level:
+        t0 = time.perf_counter_ns()
+        node = Optimizer(opt_level, max_bits=max_bits).optimize(node)
+        if stats is not None:
+            stats.phases["optimize"] = time.perf_counter_ns() - t0
+
+    # Share the subtrees that are the same
+    shared = None
+    if share:
+        t0 = time.perf_counter_ns()
+        node, shared = SubtreeSharing().share(node)
+        if stats is not None:
+            stats.phases["share"] = time.perf_counter_ns() - t0
+
+    # Give the variables their slots
+    t0 = time.perf_counter_ns()
+    resolver = Resolver(pin=False)
+    resolver.resolve(node)
+    if stats is not None:
+        stats.phases["resolve"] = time.perf_counter_ns() - t0
+
+    # Count the nodes to estimate the memory
+    node_count = count_nodes(node)
+    size += node_count * NODE_BYTES
+
+    return Program(node, None, size, token_count, node_count, shared, resolver.slots)
+
+# A user's own variables
+# Sessions do not share variables, so different sessions can run at the same time in different threads
+# One session should only run one piece of code at a time
+class Session:
+    # Initialize
+    # The symbol table starts empty, built-in variables are read from `builtin_symbol_table`
+    # `budget` is used for every run that is not given its own (see `Budget`)
+    def __init__(self, display_name="<program>", budget=None):
+        self.budget = budget
+        self.symbol_table = SymbolTable()
+        self.symbol_table.parent = builtin_symbol_table
+        self.context = Context(display_name)
+        self.context.symbol_table = self.symbol_table
+
+    # Run code with the variables of this session
+    # With `stats`, the times and counts of the run are put in it (see `RunStats`)
+    def run(self, fn, text, backend=None, opt_level=None, lexer=None, parser=None, stats=None, budget=None, share=None):
+        if stats is not None:
+            run_start = time.perf_counter_ns()
+
+        program = self.compile(fn, text, opt_level, lexer, parser, stats, share, fold_limit(budget or self.budget))
+        value, error = self.execute(fn, program, backend, stats, budget)
+        if stats is not None:
+            stats.phases["total"] = time.perf_counter_ns() - run_start
+        return value, error
+
+    # Get the program of some code from the cache, or from the disk cache, or make it
+    # `max_bits` is the size limit the optimizer keeps to (see `fold_limit`)
+    def compile(self, fn, text, opt_level=None, lexer=None, parser=None, stats=None, share=None, max_bits=None):
+        opt_level = DEFAULT_OPT_LEVEL if opt_level is None else opt_level
+        share = DEFAULT_SHARE if share is None else share
+        key = (fn, text, opt_level, share, max_bits)
+        program = compile_cache.get(key) if compile_cache.enabled else None
+        if program is None:
+            disk = disk_cache if disk_cache is not None and disk_cache.enabled else None
+            if disk is not None:
+                if stats is not None:
+                    start = time.perf_counter_ns()
+                program = disk.get(fn, text, opt_level, share, max_bits)
+                if stats is not None and program is not None:
+                    stats.phases["load"] = time.perf_counter_ns() - start
+            if program is None:
+                program = compile_program(fn, text, lexer, opt_level, parser, stats, share=share, max_bits=max_bits)
+                if disk is not None:
+                    disk.put(fn, text, opt_level, share, max_bits, program)
+            if compile_cache.enabled:
+                compile_cache.put(key, program)
+        elif stats is not None:
+            stats.cache_hit = True
+            stats.tokens = program.tokens
+        if stats is not None:
+            stats.nodes = program.nodes
+        return program
+
+    # Run a compiled program with the variables of this session
+    def execute(self, fn, program, backend=None, stats=None, budget=None):
+        backend = backend or DEFAULT_BACKEND
+        budget = budget or self.budget
+        if stats is not None:
+            stats.backend = backend
+        if program.error:
+            return None, program.error
+
+        # With stats, the variables are counted on the way
+        context = self.context
+        if stats is not None:
+            context = Context(self.context.display_name)
+            context.symbol_table = CountingSymbolTable(self.symbol_table, stats)
+
+        # Programs with too many steps do not start
+        # Deadlines and sizes are checked while the program runs
+        deadline = None
+        limited = False
+        if budget is not None:
+            error = check_steps(program.node, program.nodes, budget, context)
+            if error:
+                return None, error
+            if budget.timeout is not None:
+                deadline = time.monotonic() + budget.timeout
+            limited = budget.timeout is not None or budget.max_bits is not None
+
+        # With stats, the visits are counted on the way
+        # Shared nodes are only remembered by the plain interpreter, the others walk them every time
+        if stats is not None:
+            interpreter = CountingLimitedInterpreter(stats, budget, deadline) if limited else CountingInterpreter(stats)
+        elif limited:
+            interpreter = LimitedInterpreter(budget, deadline)
+        elif program.shared:
+            interpreter = MemoInterpreter(program.shared)
+        else:
+            interpreter = Interpreter()
+
+        # Run the actual code
+        if stats is not None:
+            start = time.perf_counter_ns()
+        if backend == "vm":
+            if program.code is None:
+                program.code = Compiler().compile(program.node)
+                if stats is not None:
+                    stats.phases["compile"] = time.perf_counter_ns() - start
+                    start = time.perf_counter_ns()
+            result = VM().execute(program.code, context, budget, deadline)
+        elif backend == "interpreter":
+            result = self.walk(interpreter, program, context, budget, deadline, stats)
+        elif backend == "tiered":
+            # Code that runs often is turned into Python code
+            # Python code cannot keep to a deadline or size limit, so those runs walk the tree
+            if not limited:
+                program.runs += 1
+                if program.py_program is None and program.runs > TIER_THRESHOLD:
+                    program.py_program = PyProgram(fn, program.node, program.shared or ())
+                    if stats is not None:
+                        stats.phases["tier up"] = time.perf_counter_ns() - start
+                        start = time.perf_counter_ns()
+            if program.py_program and not limited:
+                result = program.py_program.execute(context)
+            else:
+                result = self.walk(interpreter, program, context, budget, deadline, stats)
+        else:
+            raise Exception(f"Unknown backend '{backend}'")
+
+        if stats is not None:
+            stats.phases["execute"] = time.perf_counter_ns() - start
+        return result.value, result.error
+
+    # Walk the tree of a program with an interpreter
+    # Trees that are too deep for the interpreters run on the VM instead (see `max_walk_depth`)
+    def walk(self, interpreter, program, context, budget, deadline, stats):
+        if program.depth is None:
+            program.depth = tree_depth(program.node)
+        if program.depth <= max_walk_depth():
+            return interpreter.visit(program.node, context)
+
+        if program.code is None:
+            program.code = Compiler().compile(program.node)
+        if stats is not None:
+            stats.backend = "vm"
+        return VM().execute(program.code, context, budget, deadline)
+
+    # Run a file one statement at a time, statements are separated by `;`
+    # Yields the value and error of each statement
+    # The file is memory-mapped, and only the statement that is running is decoded and parsed,
+    # so the memory needed is the size of the biggest statement and not of the file
+    def iter_file(self, path, backend=None, opt_level=None, lexer=None, parser=None):
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                # Line and column of the file where the next statement starts
+                line = 0
+                col = 0
+                pos = 0
+
+                while pos <= len(data):
+                    end = data.find(b";", pos)
+                    if end == -1:
+                        end = len(data)
+
+                    # Only the statement is decoded and lexed, and the lexer is given its line and column,
+                    # so errors have the right line and column in the file
+                    # No other character in UTF-8 has the byte of `;` in it, so the file can be split there
+                    text = data[pos:end].decode("utf-8")
+                    first_line, first_col = line, col
+                    newlines = text.count("\n")
+                    if newlines:
+                        line += newlines
+                        col = len(text) - text.rfind("\n")
+                    else:
+                        col += len(text) + 1
+                    pos = end + 1
+                    if not text.strip():
+                        continue
+
+                    program = compile_program(path, text, lexer, opt_level, parser, None, 0, first_line, first_col,
+                                              max_bits=fold_limit(self.budget))
+                    yield self.execute(path, program, backend)
+
+    # Run a file, stopping at the first error
+    # Returns the value of the last statement and the error
+    def run_file(self, path, backend=None, opt_level=None, lexer=None, parser=None):
+        value = None
+        for value, error in self.iter_file(path, backend, opt_level, lexer, parser):
+            if error:
+                return None, error
+        return value, None
+
+    # Save the variables of this session to a file, so a new process can start with them
+    # Only the values are saved; built-in variables are not
+    def save_snapshot(self, path):
+        data = marshal.dumps((SNAPSHOT_FORMAT, VERSION, self.context.display_name, self.symbol_table.as_dict()))
+        write_atomic(path, data)
+
+    # Replace the variables of this session with the ones saved in a file
+    def load_snapshot(self, path):
+        with open(path, "rb") as file:
+            data = file.read()
+        try:
+            snapshot_format, version, display_name, variables = marshal.loads(data)
+        except (EOFError, ValueError, TypeError):
+            raise Exception(f"'{path}' is not a snapshot")
+        if snapshot_format != SNAPSHOT_FORMAT or version != VERSION:
+            raise Exception(f"'{path}' was saved by another version of Quartz")
+
+        self.symbol_table.clear()
+        for name, value in variables.items():
+            self.symbol_table.set(name, value)
+        self.context.display_name = display_name
+
+# Session used by `run`
+default_session = Session()
+global_symbol_table = default_session.symbol_table
+
+# Run code with the variables of the default session
+def run(fn, text, backend=None, opt_level=None, lexer=None, parser=None, stats=None, budget=None, share=None):
+    return default_session.run(fn, text, backend, opt_level, lexer, parser, stats, budget, share)
+
+# Run a file with the variables of the default session (see `Session.run_file`)
+def run_file(path, backend=None, opt_level=None, lexer=None, parser=None):
+    return default_session.run_file(path, backend, opt_level, lexer, parser)
+
+# Save the variables of the default session to a file (see `Session.save_snapshot`)
+def save_snapshot(path):
+    default_session.save_snapshot(path)
+
+# Replace the variables of the default session with the ones saved in a file
+def load_snapshot(path):
+    default_session.load_snapshot(path)
+
+
+
+# REACTIVE SESSIONS
+# Sessions that remember what each `def` reads, and recompute only what depends on a variable when it changes
+
+# A `def` in a reactive session
+# `reads` has the names its value reads, without its own name, so `def x: x + 1` reads the old `x`
+class Definition:
+    __slots__ = ("name", "fn", "program", "reads")
+
+    # Initialize
+    def __init__(self, name, fn, program, reads):
+        self.name = name
+        self.fn = fn
+        self.program = program
+        self.reads = reads
 
+# What happened to the other variables after a run of a reactive session
+# `recomputed` has the names that were run again, in the order they ran
+# `skipped` is the number of definitions that were not run again, `nodes` is the number of nodes that were
+# `errors` has the name and error of each definition that failed; those keep their old values
+class Update:
+    __slots__ = ("recomputed", "skipped", "nodes", "errors")
 
+    # Initialize
+    def __init__(self):
+        self.recomputed = []
+        self.skipped = 0
+        self.nodes = 0
+        self.errors = []
 
+    # Represent
+    def __repr__(self):
+        return f"{len(self.recomputed)} recomputed ({self.nodes} nodes), {self.skipped} skipped, {len(self.errors)} errors"
+
+# Find the definitions in a tree and the names each of them reads
+# Returns a list of (VarAssignNode, names)
+def find_definitions(node):
+    definitions = []
+    reads = []
+    stack = [(node, False)]
+
+    while stack:
+        node, children_done = stack.pop()
+        node_type = type(node)
+
+        # The names read by a definition are the ones read while its value was walked
+        if node_type is VarAssignNode:
+            if children_done:
+                names = reads.pop()
+                name = node.var_name_tok.value
+                definitions.append((node, names - {name}))
+                if reads:
+                    reads[-1] |= names
+                continue
+            reads.append(set())
+            stack.append((node, True))
+        elif node_type is VarAccessNode and reads:
+            reads[-1].add(node.var_name_tok.value)
+
+        for field in reversed(NODE_CHILDREN[node_type]):
+            stack.append((getattr(node, field), False))
+
+    return definitions
+
+class ReactiveSession(Session):
+    # Initialize
+    def __init__(self, display_name="<program>", budget=None):
+        super().__init__(display_name, budget)
+        self.definitions = {}
+        self.readers = {}
+        self.last_update = Update()
+
+    # Run code, then recompute the definitions that read the variables it defined
+    # A `def` that would make a circular definition is not run
+    def run(self, fn, text, backend=None, opt_level=None, lexer=None, parser=None, stats=None, budget=None, share=None):
+        program = self.compile(fn, text, opt_level, lexer, parser, stats, share, fold_limit(budget or self.budget))
+        self.last_update = Update()
+        definitions = [] if program.error else find_definitions(program.node)
+
+        # Checks for circular definitions
+        for node, reads in definitions:
+            error = self.find_cycle(node, reads)
+            if error:
+                return None, error
+
+        value, error = self.execute(fn, program, backend, stats, budget)
+        if error or not definitions:
+            return value, error
+
+        # Remember the new definitions
+        for node, reads in definitions:
+            definition_program = program if node is program.node else Program(node, None, 0, None, count_nodes(node))
+            self.define(Definition(node.var_name_tok.value, fn, definition_program, reads))
+
+        self.update([node.var_name_tok.value for node, _ in definitions], backend, budget)
+        return value, error
+
+    # Replace the definition of a variable
+    def define(self, definition):
+        old = self.definitions.get(definition.name)
+        if old is not None:
+            for name in old.reads:
+                self.readers[name].discard(old.name)
+        for name in definition.reads:
+            self.readers.setdefault(name, set()).add(definition.name)
+        self.definitions[definition.name] = definition
+
+    # Find the names that read a name, and the names that read those, and so on
+    def dependents(self, name):
+        found = set()
+        stack = [name]
+        while stack:
+            for reader in self.readers.get(stack.pop(), ()):
+                if reader not in found:
+                    found.add(reader)
+                    stack.append(reader)
+        return found
+
+    # Make an error if defining a variable with these reads would make it depend on itself
+    def find_cycle(self, node, reads):
+        name = node.var_name_tok.value
+        cycle = reads & self.dependents(name)
+        if not cycle:
+            return None
+        other = min(cycle)
+        return RTError(
+            node.pos_start, node.pos_end,
+            f"Circular definition: '{name}' reads '{other}', which depends on '{name}'",
+            self.context
+        )
 
+    # Recompute the definitions that depend on the changed names, in topological order
+    # A definition only runs again if something it reads really changed
+    def update(self, changed_names, backend=None, budget=None):
+        update = self.last_update
+        changed = set(changed_names)
+        affected = set()
+        for name in changed_names:
+            affected |= self.dependents(name)
+        affected -= changed
+
+        # Number of affected names each affected definition reads
+        waiting = {name: len(self.definitions[name].reads & affected) for name in affected}
+        ready = sorted(name for name, count in waiting.items() if count == 0)
+        done = 0
+
+        while ready:
+            name = ready.pop()
+            definition = self.definitions[name]
+            done += 1
+
+            if definition.reads & changed:
+                old = self.symbol_table.get(name)
+                value, error = self.execute(definition.fn, definition.program, backend, None, budget)
+                update.recomputed.append(name)
+                update.nodes += definition.program.nodes
+                if error:
+                    update.errors.append((name, error))
+                elif type(value) is not type(old) or value != old:
+                    changed.add(name)
+
+            for reader in self.readers.get(name, ()):
+                if reader in waiting:
+                    waiting[reader] -= 1
+                    if waiting[reader] == 0:
+                        ready.append(reader)
+
+        # Names that never got ready are in a cycle
+        # Cycles are stopped when they are defined, so this only happens if the definitions were changed by hand
+        if done < len(affected):
+            names = ", ".join(sorted(name for name, count in waiting.items() if count))
+            raise Exception(f"Circular definitions: {names}")
+
+        update.skipped = len(self.definitions) - len(update.recomputed) - len(set(changed_names))
+        return update
+
+
+
+# RUN MANY
+# Run a lot of independent code at once in a pool of processes
+# Every process has its own global symbol table and caches, and keeps them between batches
+
+# Number of programs sent to a process at a time
+DEFAULT_CHUNKSIZE = 256
+
+# Batches waiting or running in the pool for each process
+CHUNKS_PER_WORKER = 4
+
+# Make the error of code whose run raised a Python error, like a float that is too big
+# Where it happened is not known, so the error points at the whole code
+def python_error(fn, text, exception):
+    source = Source(fn, text)
+    return Error(Position(0, source), Position(len(text), source), type(exception).__name__, str(exception))
+
+# Run a batch of code in a process of the pool
+# Python errors are returned as the error of their item, so one item cannot stop the whole batch
+# Returns the index of the first item and the value and error of each item
+def run_chunk(start, items, backend, opt_level, budget):
+    results = []
+    for fn, text in items:
+        try:
+            results.append(run(fn, text, backend, opt_level, budget=budget))
+        except Exception as exception:
+            results.append((None, python_error(fn, text, exception)))
+    return start, results
+
+# Run a lot of (fn, text) pairs in a pool of processes
+# With `ordered`, yields (value, error) in the same order as the items
+# Otherwise yields (index, value, error) as soon as each batch is done
+# Items are read while the pool runs, so they can be a generator of any length
+# `budget` is used for every item (see `Budget`)
+def run_many(items, workers=None, chunksize=None, ordered=True, backend=None, opt_level=None, budget=None):
+    workers = workers or os.cpu_count() or 1
+    chunksize = chunksize or DEFAULT_CHUNKSIZE
+    items = iter(items)
+    start = 0
+
+    with ProcessPoolExecutor(workers) as pool:
+        # Send the next batch to the pool, if there is one
+        def submit():
+            nonlocal start
+            chunk = list(itertools.islice(items, chunksize))
+            if not chunk:
+                return None
+            future = pool.submit(run_chunk, start, chunk, backend, opt_level, budget)
+            start += len(chunk)
+            return future
+
+        # Keep a few batches for each process in the pool
+        pending = deque()
+        for _ in range(workers * CHUNKS_PER_WORKER):
+            future = submit()
+            if future is None:
+                break
+            pending.append(future)
+
+        while pending:
+            # Wait for the oldest batch
+            if ordered:
+                done = [pending.popleft()]
+            # Wait for any batch
+            else:
+                done = wait(pending, return_when=FIRST_COMPLETED).done
+                for future in done:
+                    pending.remove(future)
+
+            for future in done:
+                chunk_start, results = future.result()
+                next_future = submit()
+                if next_future is not None:
+                    pending.append(next_future)
+
+                if ordered:
+                    yield from results
+                else:
+                    for index, (value, error) in enumerate(results, chunk_start):
+                        yield index, value, error
@@ -0,0 +1,319 @@
+# SERVER
+# Runs code sent over a socket, so clients do not have to start a new Python process for every piece of code
+#
+# Usage: python server.py [--port PORT | --unix PATH] [--workers N]
+#
+# Protocol: one JSON object per line in each direction
+#     request:  {"id": 1, "text": "def x: 5 * 2", "fn": "<client>"}
+#     response: {"id": 1, "result": 10, "error": null, "latency_ms": 0.21}
+# `fn` is optional, `id` is sent back as it was received
+# Every connection has its own session, so its variables are kept between its requests
+
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import quartz
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7384
+
+# Most requests a worker runs at once
+BATCH_SIZE = 256
+
+# Time to wait for more requests before a batch runs, in seconds
+BATCH_WAIT = 0.001
+
+# Limits of each request, so one slow request does not hold up the others (see `quartz.Budget`)
+BUDGET = quartz.Budget(max_steps=1_000_000, timeout=1.0, max_bits=1_000_000)
+
+# Code each worker runs when it starts, so its imports and caches are ready
+WARM_UP_CODE = ["def warm: 1 + 2 * 3 - 4 / 5 % 6 ^ 7", "warm * -warm"]
+
+
+
+# WORKER
+# Runs in the worker processes
+
+# Session of each client of this worker
+sessions = {}
+
+# Get the worker ready
+def warm_up():
+    session = quartz.Session()
+    for text in WARM_UP_CODE:
+        session.run("<warm up>", text)
+    return os.getpid()
+
+# Run a batch of (client, fn, text) requests
+# Text that is None closes the session of the client
+# Returns the result and error message of each request
+def run_batch(batch):
+    results = []
+    for client, fn, text in batch:
+        if text is None:
+            sessions.pop(client, None)
+            results.append((None, None))
+            continue
+
+        session = sessions.get(client)
+        if session is None:
+            session = sessions[client] = quartz.Session(budget=BUDGET)
+        # Python errors, like a float that is too big, are sent back instead of stopping the worker
+        try:
+            result, error = session.run(fn, text)
+        except Exception as error:
+            results.append((None, f"{type(error).__name__}: {error}"))
+            continue
+
+        # JSON does not have complex numbers, infinities or integers with too many digits (see `quartz.json_value`)
+        results.append((quartz.json_value(result), error.as_string() if error else None))
+    return results
+
+
+
+# SERVER
+
+# A request waiting to run
+class Request:
+    __slots__ = ("client", "id", "fn", "text", "connection", "received")
+
+    # Initialize
+    def __init__(self, client, id, fn, text, connection, received):
+        self.client = client
+        self.id = id
+        self.fn = fn
+        self.text = text
+        self.connection = connection
+        self.received = received
+
+# A worker process with its own queue of requests
+# Requests are put together into batches while the worker is busy with the last batch
+class Worker:
+    # Initialize
+    def __init__(self, batch_size, batch_wait):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.requests = queue.Queue()
+        self.start_pool()
+        self.thread = threading.Thread(target=self.dispatch, daemon=True)
+        self.thread.start()
+
+    # Start the worker process and get it ready
+    def start_pool(self):
+        self.pool = ProcessPoolExecutor(1)
+        self.pool.submit(warm_up).result()
+
+    # Send batches of requests to the worker process
+    # A request that is None stops the worker
+    def dispatch(self):
+        while True:
+            batch = [self.requests.get()]
+            if batch[0] is None:
+                break
+
+            # Take the requests that are waiting, and wait a little for more
+            deadline = time.perf_counter() + self.batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    request = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.requests.put(None)
+                    break
+                batch.append(request)
+
+            # A batch that fails, like one whose worker process died, gets an error for each of its requests,
+            # so the requests after it still run; a dead worker process is started again without its sessions
+            try:
+                results = self.pool.submit(
+                    run_batch, [(request.client, request.fn, request.text) for request in batch]
+                ).result()
+            except Exception as error:
+                results = [(None, f"Server error: {type(error).__name__}: {error}")] * len(batch)
+                if isinstance(error, BrokenProcessPool):
+                    self.start_pool()
+
+            for request, (result, error) in zip(batch, results):
+                if request.connection is not None:
+                    request.connection.reply(request, result, error)
+
+    # Stop the worker
+    def close(self):
+        self.requests.put(None)
+        self.thread.join()
+        self.pool.shutdown()
+
+# A connection from a client
+class Connection(socketserver.StreamRequestHandler):
+    # Read requests until the client closes the connection
+    def handle(self):
+        server = self.server.quartz_server
+        client = server.new_client()
+        worker = server.workers[client % len(server.workers)]
+        self.write_lock = threading.Lock()
+        self.pending = 0
+        self.done = threading.Condition()
+
+        for line in self.rfile:
+            received = time.perf_counter()
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+                text = message["text"]
+                if type(text) is not str:
+                    raise ValueError("'text' must be a string")
+            except (ValueError, KeyError, TypeError) as error:
+                self.send({"id": None, "result": None, "error": f"Invalid request: {error}", "latency_ms": 0})
+                continue
+
+            with self.done:
+                self.pending += 1
+            worker.requests.put(Request(
+                client, message.get("id"), message.get("fn", "<client>"), text, self, received
+            ))
+
+        # Close the session of the client after its last request
+        worker.requests.put(Request(client, None, None, None, None, None))
+
+        # The client can stop sending and still read, so wait for the results it has not got yet
+        with self.done:
+            self.done.wait_for(lambda: self.pending == 0)
+
+    # Send the result of a request
+    def reply(self, request, result, error):
+        latency = (time.perf_counter() - request.received) * 1000
+        self.send({"id": request.id, "result": result, "error": error, "latency_ms": round(latency, 3)})
+        with self.done:
+            self.pending -= 1
+            self.done.notify()
+
+    # Send a JSON message
+    def send(self, message):
+        data = (json.dumps(message) + "\n").encode()
+        with self.write_lock:
+            try:
+                self.wfile.write(data)
+            except OSError:
+                pass
+
+class TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+class Server:
+    # Initialize
+    # `address` is a (host, port) pair for TCP, or a path for a Unix socket
+    def __init__(self, address=(DEFAULT_HOST, DEFAULT_PORT), workers=None,
+                 batch_size=BATCH_SIZE, batch_wait=BATCH_WAIT):
+        self.workers = [Worker(batch_size, batch_wait) for _ in range(workers or os.cpu_count() or 1)]
+        self.clients = 0
+        self.clients_lock = threading.Lock()
+
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.unlink(address)
+            self.server = UnixServer(address, Connection)
+        else:
+            self.server = TCPServer(address, Connection)
+        self.server.quartz_server = self
+        self.address = self.server.server_address
+
+    # Get a number for a new client
+    def new_client(self):
+        with self.clients_lock:
+            self.clients += 1
+            return self.clients
+
+    # Answer requests until `shutdown` is called
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    # Stop the server and its workers
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for worker in self.workers:
+            worker.close()
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+
+# CLIENT
+
+class Client:
+    # Initialize
+    # `address` is a (host, port) pair for TCP, or a path for a Unix socket
+    def __init__(self, address=(DEFAULT_HOST, DEFAULT_PORT)):
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.socket.connect(address)
+        self.file = self.socket.makefile("rwb")
+        self.next_id = 0
+
+    # Run code on the server
+    # Returns the result, the error message and the latency in milliseconds
+    def run(self, text, fn="<client>"):
+        return self.run_many([text], fn)[0]
+
+    # Send many pieces of code before reading their results, so the server can batch them
+    def run_many(self, texts, fn="<client>"):
+        for text in texts:
+            self.next_id += 1
+            self.file.write((json.dumps({"id": self.next_id, "text": text, "fn": fn}) + "\n").encode())
+        self.file.flush()
+
+        results = []
+        for _ in texts:
+            message = json.loads(self.file.readline())
+            results.append((message["result"], message["error"], message["latency_ms"]))
+        return results
+
+    # Close the connection
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+
+# MAIN
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Quartz code sent over a socket")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="path of a Unix socket to use instead of TCP")
+    parser.add_argument("--workers", type=int, help="number of worker processes")
+    args = parser.parse_args()
+
+    server = Server(args.unix or (args.host, args.port), args.workers)
+    print(f"Quartz server on {server.address} with {len(server.workers)} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
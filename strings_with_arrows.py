@@ -1,32 +1,28 @@
-def string_with_arrows(text, pos_start, pos_end):
+def string_with_arrows(source, pos_start, pos_end):
     result = ''
+    text = source.text
 
     # Calculate indices
-    idx_start = max(text.rfind('\n', 0, pos_start.idx), 0)
-    idx_end = text.find('\n', idx_start + 1)
-    if idx_end < 0: idx_end = len(text)
-    
+    # Columns are found from the offsets and not from `col`, since the code can be a part of a line of a file
+    idx_start = source.rfind_newline(pos_start.idx) + 1
+    idx_end = source.find_newline(idx_start)
+
     # Generate each line
     line_count = pos_end.ln - pos_start.ln + 1
     for i in range(line_count):
         # Calculate line columns
         line = text[idx_start:idx_end]
-        col_start = pos_start.col if i == 0 else 0
-        col_end = pos_end.col if i == line_count - 1 else len(line) - 1
+        col_start = pos_start.idx - idx_start if i == 0 else 0
+        col_end = pos_end.idx - idx_start if i == line_count - 1 else len(line)
 
         # Append to result
+        if i > 0:
+            result += '\n    '
         result += line + '\n'
         result += ' ' * (col_start + 4) + '^' * (col_end - col_start)
 
         # Re-calculate indices
-        idx_start = idx_end
-        idx_end = text.find('\n', idx_start + 1)
-        if idx_end < 0: idx_end = len(text)
+        idx_start = idx_end + 1
+        idx_end = source.find_newline(idx_start)
 
     return result.replace('\t', '')
-
-
-
-
-
-
@@ -0,0 +1,166 @@
+# VECTORIZE
+# Runs one piece of code over whole NumPy columns at once instead of once per row
+#
+# Usage:
+#     result, error = vectorize.evaluate("<formula>", "price * amount / rate", columns)
+#
+# `columns` maps variable names to NumPy arrays (or plain numbers), every operator works on the whole array,
+# so the code is lexed, parsed and walked only once
+# Values follow the NumPy dtypes of the columns, so integers are 64 bit instead of unlimited
+
+import numpy
+import quartz
+
+# NumPy function for each binary operator token type
+# Division and modulo are handled by `VectorEvaluator` because they can fail on single rows
+NUMPY_FUNCTIONS = {
+    quartz.TT_PLUS: numpy.add,
+    quartz.TT_MINUS: numpy.subtract,
+    quartz.TT_MULT: numpy.multiply,
+    quartz.TT_DIV: numpy.true_divide,
+    quartz.TT_MOD: numpy.mod,
+    quartz.TT_POW: numpy.power,
+}
+
+# Result of running code over columns
+# `error_mask` is True for every row that divided by zero; the values of those rows mean nothing
+class VectorResult:
+    __slots__ = ("values", "error_mask", "error_nodes", "division_nodes", "context")
+
+    # Initialize
+    # `error_nodes` has, for every row, the index in `division_nodes` of the division that failed first, or -1
+    def __init__(self, values, error_nodes, division_nodes, context):
+        self.values = values
+        self.error_nodes = error_nodes
+        self.error_mask = error_nodes >= 0
+        self.division_nodes = division_nodes
+        self.context = context
+
+    # Get the rows that divided by zero
+    def error_rows(self):
+        return numpy.flatnonzero(self.error_mask)
+
+    # Make a runtime error for every row that divided by zero
+    # Returns a list of (row, error), the errors are only made when they are asked for
+    def errors(self):
+        rows = self.error_rows()
+        node_indexes = self.error_nodes.ravel()[rows]
+        return [
+            (int(row), quartz.division_error(self.division_nodes[node_index], self.context))
+            for row, node_index in zip(rows, node_indexes)
+        ]
+
+class VectorEvaluator:
+    # Evaluate a tree over the columns
+    # Variables that are not in the columns are looked up in the symbol table of the context
+    # Returns a runtime result whose value is a `VectorResult`
+    # Walks the tree with its own stack so deep trees do not hit the recursion limit
+    def evaluate(self, node, columns, context):
+        res = quartz.RTResult()
+        shape = numpy.broadcast_shapes(*(numpy.shape(column) for column in columns.values()))
+        bindings = dict(columns)
+        error_nodes = numpy.full(shape, -1, dtype=numpy.intp)
+        division_nodes = []
+        values = []
+        stack = [(node, False)]
+
+        with numpy.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            while stack:
+                node, children_done = stack.pop()
+                node_type = type(node)
+
+                # Number node
+                if node_type is quartz.NumberNode:
+                    values.append(node.tok.value)
+
+                # Variable access node
+                elif node_type is quartz.VarAccessNode:
+                    var_name = node.var_name_tok.value
+                    value = bindings.get(var_name)
+                    if value is None:
+                        value = context.symbol_table.get(var_name)
+
+                    # Checks if it is defined yet
+                    if value is None:
+                        return res.failure(quartz.RTError(
+                            node.pos_start, node.pos_end,
+                            f"'{var_name}' is not defined",
+                            context
+                        ))
+                    values.append(value)
+
+                # Variable assign node
+                # Assigned columns are only kept while the code runs
+                elif node_type is quartz.VarAssignNode:
+                    if children_done:
+                        bindings[node.var_name_tok.value] = values[-1]
+                    else:
+                        stack.append((node, True))
+                        stack.append((node.value_node, False))
+
+                # Binary operator node
+                elif node_type is quartz.BinOpNode:
+                    if not children_done:
+                        stack.append((node, True))
+                        stack.append((node.right_node, False))
+                        stack.append((node.left_node, False))
+                        continue
+                    right = values.pop()
+                    left = values.pop()
+                    op = node.op_tok.type
+
+                    # Rows that divide by zero are marked, unless an earlier division already failed
+                    if op in (quartz.TT_DIV, quartz.TT_MOD):
+                        zero = numpy.equal(right, 0)
+                        if numpy.any(zero):
+                            first = zero & (error_nodes < 0)
+                            error_nodes[first] = len(division_nodes)
+                            division_nodes.append(node.right_node)
+                            right = numpy.where(zero, 1, right)
+
+                    # Integers cannot be raised to negative integer powers in NumPy
+                    elif op == quartz.TT_POW:
+                        if numpy.issubdtype(numpy.result_type(left), numpy.integer) and numpy.any(numpy.less(right, 0)):
+                            left = numpy.asarray(left, dtype=numpy.float64)
+
+                    values.append(NUMPY_FUNCTIONS[op](left, right))
+
+                # Unary operator node
+                elif node_type is quartz.UnaryOpNode:
+                    if not children_done:
+                        stack.append((node, True))
+                        stack.append((node.node, False))
+                    elif node.op_tok.type == quartz.TT_MINUS:
+                        values.append(numpy.negative(values.pop()))
+
+                else:
+                    self.no_evaluate_method(node)
+
+        values = numpy.broadcast_to(values[-1], shape)
+        return res.success(VectorResult(values, error_nodes, division_nodes, context))
+
+    # Throws error if a node type cannot be evaluated over columns
+    def no_evaluate_method(self, node):
+        raise Exception(f"No evaluate method defined for {type(node).__name__}")
+
+# Run code over columns
+# Returns the `VectorResult` and the error, like `quartz.run`
+def evaluate(fn, text, columns, opt_level=None, lexer=None, parser=None):
+    opt_level = quartz.DEFAULT_OPT_LEVEL if opt_level is None else opt_level
+
+    # Get the program from the cache, or make it
+    cache = quartz.compile_cache
+    key = (fn, text, opt_level, False, None)
+    program = cache.get(key) if cache.enabled else None
+    if program is None:
+        program = quartz.compile_program(fn, text, lexer, opt_level, parser)
+        if cache.enabled:
+            cache.put(key, program)
+    if program.error:
+        return None, program.error
+
+    # Run the code over the columns
+    context = quartz.Context("<program>")
+    context.symbol_table = quartz.global_symbol_table
+    result = VectorEvaluator().evaluate(program.node, columns, context)
+    return result.value, result.error